@@ -1,6 +1,26 @@
+from betahaus.viewcomponent import pool
+from betahaus.viewcomponent.cache import FragmentCache
+from betahaus.viewcomponent.cache import _marker
+from betahaus.viewcomponent.cache import enable_permission_cache
+from betahaus.viewcomponent.cache import enable_render_memo
+from betahaus.viewcomponent.cache import get_render_memo
+from betahaus.viewcomponent.compat import HAS_ASYNC
 from betahaus.viewcomponent.decorators import view_action
+from betahaus.viewcomponent.deferred import render_deferred
+from betahaus.viewcomponent.interfaces import IFragmentCache
 from betahaus.viewcomponent.interfaces import IViewGroup
 from betahaus.viewcomponent.models import add_view_action
+from betahaus.viewcomponent.models import freeze_view_groups
+from betahaus.viewcomponent.models import get_view_group
+
+if HAS_ASYNC: # pragma: no cover
+    from betahaus.viewcomponent.aio import render_view_group_async
+
+
+#Run after all other configuration actions
+FREEZE_ORDER = 10000
+#Output types that are consumed by the caller, so they're never memoized
+_lazy_types = ('generator', 'stream')
 
 
 def render_view_group(context, request, group, **kw):
@@ -8,14 +28,51 @@ def render_view_group(context, request, group, **kw):
         specifying as_type.
         
         See IViewGroup for full options.
+
+        If the request has a RenderMemo (see betahaus.viewcomponent.cache), the result
+        is reused when the same group is rendered again with the same context and arguments.
+    """
+    util = get_view_group(request.registry, group)
+    memo = get_render_memo(request)
+    if memo is None or kw.get('as_type') in _lazy_types or not util.memoizable:
+        return util(context, request, **kw)
+    result, store = memo.lookup((group, None, tuple(sorted(kw.items()))), context)
+    if result is _marker:
+        result = util(context, request, **kw)
+        if store is not None:
+            store(result)
+    return result
+
+def view_group_etag(context, request, group, **kw):
+    """ Return a validator for the output of a view group, or None.
+        See IViewGroup.etag.
     """
-    util = request.registry.getUtility(IViewGroup, name = group)
-    return util(context, request, **kw)
+    util = get_view_group(request.registry, group)
+    return util.etag(context, request, **kw)
+
+def render_view_group_many(contexts, request, group, **kw):
+    """ Render a view group for each context in contexts and return a list
+        with the results. Work that only depends on the kind of context or its ACL
+        is shared. See IViewGroup.render_many for options.
+    """
+    util = get_view_group(request.registry, group)
+    return util.render_many(contexts, request, **kw)
 
 def render_view_action(context, request, group, name, **kw):
-    """ Return the result of a single view action."""
-    util = request.registry.getUtility(IViewGroup, name = group)
-    return util[name](context, request, **kw)
+    """ Return the result of a single view action. It's reused the same way as
+        in render_view_group.
+    """
+    util = get_view_group(request.registry, group)
+    va = util[name]
+    memo = get_render_memo(request)
+    if memo is None or not util.idempotent or not va.idempotent:
+        return va(context, request, **kw)
+    result, store = memo.lookup((group, name, tuple(sorted(kw.items()))), context)
+    if result is _marker:
+        result = va(context, request, **kw)
+        if store is not None:
+            store(result)
+    return result
 
 def _view_action_directive(config, _callable, group_name, name,
                            priority = None, registry = None,
@@ -25,9 +82,80 @@ def _view_action_directive(config, _callable, group_name, name,
                            priority = priority, registry = config.registry,
                            **kwargs)
 
+def _freeze_view_groups_directive(config):
+    """ Use via config.freeze_view_groups when you've included betahaus.viewcomponent.
+        All view groups will be frozen at the end of the configuration commit.
+    """
+    config.action(None, freeze_view_groups, args = (config.registry,), order = FREEZE_ORDER)
+
+def _enable_permission_cache(event):
+    enable_permission_cache(event.request)
+
+def _enable_render_memo(event):
+    enable_render_memo(event.request)
+
 def includeme(config):
     """ Include this if you wish to add view actions using directive instead, like:
     
         config.add_view_action(group_name, view_action_name, callable, <etc...>)
+
+        Settings:
+
+        betahaus.viewcomponent.permission_cache
+            Cache permission checks for the duration of each request.
+
+        betahaus.viewcomponent.render_memo
+            Reuse the output of render_view_group and render_view_action when the same
+            thing is rendered again within a request.
+
+        betahaus.viewcomponent.fragment_cache.size
+            Max number of cached fragments per region. (Default 1000)
+
+        betahaus.viewcomponent.fragment_cache.regions
+            Size of specific regions, written as name:size separated by whitespace.
+
+        betahaus.viewcomponent.concurrent
+            Render all view groups created after this in the shared thread pool.
+
+        betahaus.viewcomponent.concurrent_groups
+            Names of view groups to render in the shared thread pool.
+
+        betahaus.viewcomponent.pool_size
+            Number of threads in the shared thread pool. (Default 10)
+
+        betahaus.viewcomponent.process_pool_size
+            Number of processes in the shared process pool. (Default number of CPUs)
+
+        betahaus.viewcomponent.freeze
+            Freeze all view groups when the configuration is committed.
+
+        betahaus.viewcomponent.visibility_cache
+            Keep permission results between requests in view groups created after this.
+            The value is the max number of principal, ACL and context type combinations
+            per group. Only use it with ACL based authorization. See VisibilityCache.
     """
+    from pyramid.events import NewRequest
+    from pyramid.settings import asbool
+    from pyramid.settings import aslist
     config.add_directive('add_view_action', _view_action_directive)
+    config.add_directive('freeze_view_groups', _freeze_view_groups_directive)
+    settings = config.registry.settings or {}
+    if asbool(settings.get('betahaus.viewcomponent.permission_cache', False)):
+        config.add_subscriber(_enable_permission_cache, NewRequest)
+    if asbool(settings.get('betahaus.viewcomponent.render_memo', False)):
+        config.add_subscriber(_enable_render_memo, NewRequest)
+    if settings.get('betahaus.viewcomponent.pool_size'):
+        pool.configure(settings['betahaus.viewcomponent.pool_size'])
+    if settings.get('betahaus.viewcomponent.process_pool_size'):
+        pool.configure_processes(settings['betahaus.viewcomponent.process_pool_size'])
+    if asbool(settings.get('betahaus.viewcomponent.freeze', False)):
+        config.freeze_view_groups()
+    size = settings.get('betahaus.viewcomponent.fragment_cache.size')
+    regions = aslist(settings.get('betahaus.viewcomponent.fragment_cache.regions', ''))
+    if size or regions:
+        region_sizes = {}
+        for region in regions:
+            name, region_size = region.split(':')
+            region_sizes[name] = int(region_size)
+        cache = FragmentCache(default_size = int(size or 1000), region_sizes = region_sizes)
+        config.registry.registerUtility(cache, IFragmentCache)
@@ -0,0 +1,171 @@
+""" asyncio support. This module requires Python 3.6 or later and is only
+    imported when it's available, see compat.HAS_ASYNC. asyncio itself
+    is imported the first time it's used, since it's slow to import.
+
+    View actions may use coroutine functions as callables. They're awaited when
+    rendered through the async methods. Regular callables work as well
+    and are called as usual.
+"""
+import logging
+
+from zope.interface import implementer
+
+from betahaus.viewcomponent.cache import _marker as _missing
+from betahaus.viewcomponent.cache import lookup_fragment
+from betahaus.viewcomponent.deferred import defer
+from betahaus.viewcomponent.interfaces import IAsyncViewGroup
+from betahaus.viewcomponent.stats import clock
+from betahaus.viewcomponent.stats import render_hooks
+from betahaus.viewcomponent.stats import report
+
+
+logger = logging.getLogger(__name__)
+
+_marker = object()
+#Same as in models
+_empty_vals = ('', None)
+
+
+async def render_async(view_action, context, request, **kw):
+    """ Return the output of view_action without checking predicates.
+        The output of coroutine functions is awaited, and the fragment cache
+        is used the same way as for regular callables. View actions with the
+        process option are awaited while they run in the process pool.
+    """
+    from inspect import iscoroutinefunction
+    if view_action.kwargs.get('process'):
+        return await _render_process(view_action, context, request, kw)
+    if not iscoroutinefunction(view_action.callable):
+        return view_action.render(context, request, **kw)
+    breaker = view_action.kwargs.get('breaker')
+    if breaker is not None:
+        return await _render_with_breaker(view_action, breaker, context, request, kw)
+    if not render_hooks:
+        return await _render_coroutine(view_action, context, request, kw)
+    start = clock()
+    try:
+        result = await _render_coroutine(view_action, context, request, kw)
+    except Exception as exc:
+        report(view_action, 'error', clock() - start, exception = exc)
+        raise
+    report(view_action, 'rendered', clock() - start, result)
+    return result
+
+async def _render_with_breaker(view_action, breaker, context, request, kw):
+    """ Same as ViewAction._render_with_breaker, for coroutine functions. """
+    if not breaker.allow():
+        if render_hooks:
+            report(view_action, 'open')
+        return view_action.kwargs.get('fallback')
+    start = clock()
+    try:
+        result = await _render_coroutine(view_action, context, request, kw)
+    except Exception as exc:
+        duration = clock() - start
+        breaker.failure()
+        logger.exception("View action %r in group %r failed, using the fallback",
+                         view_action.name, getattr(view_action.parent, 'name', None))
+        if render_hooks:
+            report(view_action, 'error', duration, exception = exc)
+        return view_action.kwargs.get('fallback')
+    duration = clock() - start
+    breaker.success(duration)
+    if render_hooks:
+        report(view_action, 'rendered', duration, result)
+    return result
+
+async def _render_process(view_action, context, request, kw):
+    import asyncio
+    #models imports this module
+    from betahaus.viewcomponent.models import _ProcessCall
+    call = _ProcessCall(view_action, context, request, kw)
+    #Wait without raising, result() reports and raises any exception
+    await asyncio.wait([asyncio.wrap_future(call.future)])
+    return call.result()
+
+async def _render_coroutine(view_action, context, request, kw):
+    store = None
+    if 'cache_key' in view_action.kwargs:
+        result, store = lookup_fragment(view_action, context, request, **kw)
+        if result is not _missing:
+            return result
+    result = await view_action.callable(context, request, view_action, **kw)
+    if store is not None:
+        store(result)
+    return result
+
+
+@implementer(IAsyncViewGroup)
+class AsyncViewGroupMixin(object):
+    """ Async render methods for ViewGroup. The view actions are started as tasks
+        in order and gathered, so coroutines run concurrently. Predicates are checked
+        before anything is started.
+    """
+    __slots__ = ()
+
+    def _start_async(self, context, request, kw, include_skipped = False):
+        import asyncio
+        tasks = []
+        for name, va, mode in self._iter_allowed(context, request, include_skipped):
+            if va is not None:
+                if mode == 'deferred':
+                    placeholder = defer(va, context, request, kw)
+                    va = asyncio.get_event_loop().create_future()
+                    va.set_result(placeholder)
+                else:
+                    va = asyncio.ensure_future(render_async(va, context, request, **kw))
+            tasks.append((name, va))
+        return tasks
+
+    async def _iter_output_async(self, context, request, kw, include_skipped = False):
+        tasks = self._start_async(context, request, kw, include_skipped)
+        try:
+            for name, task in tasks:
+                if task is None:
+                    yield name, None
+                else:
+                    yield name, await task
+        finally:
+            for name, task in tasks:
+                if task is not None:
+                    task.cancel()
+
+    async def as_generator_async(self, context, request, empty_val = _marker, **kw):
+        async for (k, res) in self._iter_output_async(context, request, kw, empty_val is not _marker):
+            if res in _empty_vals:
+                if empty_val is not _marker:
+                    yield empty_val
+            else:
+                yield res
+
+    async def as_list_async(self, context, request, empty_val = _marker, **kw):
+        return [x async for x in self.as_generator_async(context, request, empty_val = empty_val, **kw)]
+
+    async def as_dict_async(self, context, request, empty_val = _marker, **kw):
+        va_output = {}
+        async for (k, res) in self._iter_output_async(context, request, kw, empty_val is not _marker):
+            if res in _empty_vals:
+                if empty_val is not _marker:
+                    va_output[k] = empty_val
+            else:
+                va_output[k] = res
+        return va_output
+
+
+async def render_view_group_async(context, request, group, as_type = None, spacer = "",
+                                  empty_val = _marker, **kw):
+    """ Async version of render_view_group. as_type 'generator' returns an async generator,
+        everything else must be awaited.
+    """
+    #models imports this module
+    from betahaus.viewcomponent.models import get_view_group
+    util = get_view_group(request.registry, group)
+    if as_type is None:
+        return spacer.join(await util.as_list_async(context, request, empty_val = empty_val, **kw))
+    if as_type == 'generator':
+        return util.as_generator_async(context, request, empty_val = empty_val, **kw)
+    try:
+        type_method = getattr(util, 'as_%s_async' % as_type)
+    except AttributeError:
+        raise ValueError("as_type must be a valid output type or None, was: %r" % as_type)
+    return await type_method(context, request, empty_val = empty_val, **kw)
@@ -0,0 +1,325 @@
+""" Benchmarks for view group construction, ordering and rendering.
+    Runs offline with pyramid.testing fixtures. Run with:
+
+        python -m betahaus.viewcomponent.benchmarks --json results.json
+
+    and compare two runs (for instance before and after a release) with:
+
+        python -m betahaus.viewcomponent.benchmarks --compare old.json new.json
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+try:
+    import tracemalloc
+except ImportError: # pragma: no cover
+    #Python 2
+    tracemalloc = None
+
+from pyramid import testing
+from pyramid.registry import Registry
+
+from betahaus.viewcomponent.fixtures import contexts
+
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """ Register a benchmark. func is called with size and returns a callable to time. """
+    BENCHMARKS.append(func)
+    return func
+
+def _name_callable(context, request, va, **kw):
+    return va.name
+
+def _allow(permission, context, request):
+    return True
+
+def _deep_context(depth):
+    """ Return a context depth levels down, with an organisation at the top. """
+    root = contexts.Root()
+    root['org'] = node = contexts.Organisation()
+    for i in range(depth):
+        node['c'] = child = testing.DummyResource()
+        node = child
+    return node
+
+def _group(size, mix = 'none'):
+    """ A ViewGroup with size view actions.
+        mix is which predicates the view actions have: none, interface, permission,
+        containment or all (a mix of them).
+    """
+    from betahaus.viewcomponent.models import ViewAction
+    from betahaus.viewcomponent.models import ViewGroup
+    vg = ViewGroup('bench', perm_checker = _allow)
+    options = {'none': ({},),
+               'interface': ({'interface': contexts.IRoot}, {'interface': contexts.IOrganisation}),
+               'permission': ({'permission': 'View'}, {'permission': 'Edit'}),
+               'containment': ({'containment': contexts.IOrganisation},),
+               'all': ({}, {'interface': contexts.IRoot}, {'permission': 'View'},
+                       {'containment': contexts.IOrganisation})}[mix]
+    for i in range(size):
+        vg.add(ViewAction(_name_callable, 'va%s' % i, **options[i % len(options)]))
+    return vg
+
+
+@benchmark
+def register(size):
+    from betahaus.viewcomponent.models import add_view_action
+    def run():
+        registry = Registry('bench')
+        for i in range(size):
+            add_view_action(_name_callable, 'bench', 'va%s' % i, registry = registry)
+    return run
+
+@benchmark
+def register_priority(size):
+    from betahaus.viewcomponent.models import add_view_action
+    priorities = [random.Random(i).randint(0, 100) for i in range(size)]
+    def run():
+        registry = Registry('bench')
+        for i in range(size):
+            add_view_action(_name_callable, 'bench', 'va%s' % i,
+                            priority = priorities[i], registry = registry)
+    return run
+
+@benchmark
+def order_setter(size):
+    vg = _group(size)
+    new_order = list(reversed(vg.order))
+    def run():
+        vg.order = new_order
+    return run
+
+def _render(as_type, mix, depth = 0):
+    def _bench(size):
+        vg = _group(size, mix)
+        context = _deep_context(depth)
+        request = testing.DummyRequest()
+        method = getattr(vg, 'as_%s' % as_type)
+        if as_type == 'generator':
+            return lambda: list(method(context, request))
+        return lambda: method(context, request)
+    _bench.__name__ = 'as_%s_%s%s' % (as_type, mix, depth and '_depth%s' % depth or '')
+    return _bench
+
+for _as_type in ('generator', 'list', 'dict', 'bytes'):
+    for _mix in ('none', 'interface', 'permission', 'all'):
+        benchmark(_render(_as_type, _mix))
+    benchmark(_render(_as_type, 'containment', depth = 10))
+
+@benchmark
+def render_view_group(size):
+    from betahaus.viewcomponent import render_view_group
+    from betahaus.viewcomponent.models import add_view_action
+    registry = Registry('bench')
+    for i in range(10):
+        add_view_action(_name_callable, 'bench%s' % i, 'va', registry = registry)
+    request = testing.DummyRequest()
+    request.registry = registry
+    names = ['bench%s' % (i % 10) for i in range(size)]
+    def run():
+        for name in names:
+            render_view_group(None, request, name)
+    return run
+
+
+class _UnslottedViewAction(object):
+    """ Copy of ViewAction as it was stored before version 0.5, with an instance dict
+        and its own kwargs dict. Used as a baseline, so it only has the same attributes.
+    """
+
+    def __init__(self, _callable, name, title = u"",
+                 permission = None, interface = None, containment = None, priority=None, **kw):
+        self.callable = _callable
+        self.name = name
+        self.title = title
+        self.permission = permission
+        self.interface = interface
+        self.containment = containment
+        self.priority = priority
+        self.kwargs = kw
+        self.parent = None
+
+def _footprint(objects):
+    """ Shallow size of objects with their instance dict and kwargs, in bytes.
+        Used when tracemalloc isn't available.
+    """
+    seen = set()
+    total = 0
+    for obj in objects:
+        for part in (obj, getattr(obj, '__dict__', None), obj.kwargs):
+            if part is not None and id(part) not in seen:
+                seen.add(id(part))
+                total += sys.getsizeof(part)
+    return total
+
+def _measure(factory, size):
+    if tracemalloc is None: # pragma: no cover
+        return _footprint([factory(_name_callable, 'va%s' % i) for i in range(size)]) / float(size)
+    gc.collect()
+    #The names are allocated up front so only the view actions are measured
+    names = ['va%s' % i for i in range(size)]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [factory(_name_callable, name) for name in names]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    #Remove the list holding them
+    after -= sys.getsizeof(objects)
+    return (after - before) / float(size)
+
+def memory_usage(size = 1000):
+    """ Return the average memory footprint per view action in bytes, for ViewAction
+        and for the unslotted baseline. View actions have no options, which is the common case.
+    """
+    from betahaus.viewcomponent.models import ViewAction
+    return {'view_action': _measure(ViewAction, size),
+            'view_action_unslotted': _measure(_UnslottedViewAction, size),
+            'method': tracemalloc is None and 'getsizeof' or 'tracemalloc'}
+
+
+_startup_script = """
+import json, sys, time
+clock = getattr(time, 'perf_counter', time.time)
+start = clock()
+import betahaus.viewcomponent
+imported = clock()
+import %(package)s
+plugins = clock()
+pyramid_loaded = 'pyramid.security' in sys.modules
+from pyramid.config import Configurator
+config = Configurator()
+config.include('betahaus.viewcomponent')
+scan_start = clock()
+config.scan(%(package)s)
+done = clock()
+print(json.dumps({'import': imported - start, 'import_plugins': plugins - imported,
+                  'scan': done - scan_start, 'pyramid_loaded': pyramid_loaded}))
+"""
+
+_plugin_module = """
+from betahaus.viewcomponent import view_action
+
+"""
+
+_plugin_action = """
+@view_action('group%(group)s', 'va%(i)s', priority = %(priority)s)
+def va%(i)s(context, request, va, **kw):
+    return va.name
+"""
+
+def _write_plugins(path, package, size, modules = 10):
+    """ Write a package with size decorated view actions spread over modules. """
+    root = os.path.join(path, package)
+    os.mkdir(root)
+    with open(os.path.join(root, '__init__.py'), 'w') as f:
+        f.write('\n'.join(['from %s import m%s' % (package, x) for x in range(modules)]))
+    for module in range(modules):
+        with open(os.path.join(root, 'm%s.py' % module), 'w') as f:
+            f.write(_plugin_module)
+            for i in range(module, size, modules):
+                f.write(_plugin_action % {'group': i % 10, 'i': i, 'priority': i % 7})
+
+def startup_usage(size = 1000):
+    """ Import betahaus.viewcomponent and a package with size decorated view actions
+        in a new interpreter, then scan the package. Returns the time each step took
+        and if pyramid.security was loaded by the imports.
+    """
+    path = tempfile.mkdtemp()
+    package = 'bench_plugins'
+    try:
+        _write_plugins(path, package, size)
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([path] + sys.path)
+        output = subprocess.check_output([sys.executable, '-c', _startup_script % {'package': package}],
+                                         env = env)
+    finally:
+        shutil.rmtree(path)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def run_benchmarks(size = 1000, repeat = 5, number = 10, selected = None):
+    """ Run all benchmarks (or the ones named in selected) and return a dict with the results.
+        Times are seconds per call. Memory usage and startup time are always included.
+    """
+    results = {}
+    for func in BENCHMARKS:
+        if selected and func.__name__ not in selected:
+            continue
+        runner = func(size)
+        times = [x / number for x in timeit.Timer(runner).repeat(repeat = repeat, number = number)]
+        results[func.__name__] = {'best': min(times), 'mean': sum(times) / len(times), 'runs': times}
+    return {'meta': {'python': platform.python_version(),
+                     'implementation': platform.python_implementation(),
+                     'version': _version(),
+                     'time': time.time(),
+                     'size': size, 'repeat': repeat, 'number': number},
+            'results': results,
+            'memory': memory_usage(size),
+            'startup': startup_usage(size)}
+
+def compare(old, new):
+    """ Return a list of (name, old best, new best, ratio) for benchmarks in both results. """
+    rows = []
+    for name in sorted(new['results']):
+        if name in old['results']:
+            before = old['results'][name]['best']
+            after = new['results'][name]['best']
+            rows.append((name, before, after, before and after / before or None))
+    return rows
+
+def _version():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('betahaus.viewcomponent').version
+    except Exception: # pragma: no cover
+        return None
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark betahaus.viewcomponent")
+    parser.add_argument('--size', type = int, default = 1000, help = "Number of view actions or calls")
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--number', type = int, default = 10)
+    parser.add_argument('--json', help = "Write results to this file")
+    parser.add_argument('--compare', nargs = 2, metavar = ('OLD', 'NEW'),
+                        help = "Compare two result files instead of running")
+    parser.add_argument('benchmarks', nargs = '*', help = "Only run these")
+    args = parser.parse_args(argv)
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        for (name, before, after, ratio) in compare(old, new):
+            print("%-32s %12.6f %12.6f %8.2fx" % (name, before, after, ratio or 0))
+        return
+    results = run_benchmarks(args.size, args.repeat, args.number, args.benchmarks)
+    for name in sorted(results['results']):
+        print("%-32s %12.6f s" % (name, results['results'][name]['best']))
+    for name in ('view_action', 'view_action_unslotted'):
+        print("memory %-25s %12.1f bytes" % (name, results['memory'][name]))
+    for name in ('import', 'import_plugins', 'scan'):
+        print("startup %-24s %12.6f s" % (name, results['startup'][name]))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent = 2, sort_keys = True)
+
+
+if __name__ == '__main__': # pragma: no cover
+    main(sys.argv[1:])
@@ -0,0 +1,102 @@
+""" Circuit breaker for view actions that keep failing or are slow.
+    Pass one as the breaker option of a view action:
+
+    >>> from betahaus.viewcomponent.breaker import CircuitBreaker
+    >>> @view_action('sidebar', 'weather', breaker = CircuitBreaker(failures = 3, slow = 0.5))
+    ... def weather(context, request, va, **kw):
+    ...     return fetch_weather_widget()
+
+    Exceptions from a view action with a breaker are logged instead of raised,
+    and the fallback option (default None) is returned instead.
+"""
+import threading
+from collections import deque
+
+from betahaus.viewcomponent.stats import clock
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    """ Trips after the given number of failures within window seconds. Failures are
+        exceptions, and calls that took longer than slow seconds if slow is set.
+        While it's open, the view action isn't called. After cooldown seconds
+        one call is let through. If it succeeds the breaker closes again,
+        otherwise it stays open for another cooldown.
+    """
+
+    def __init__(self, failures = 5, window = 60, cooldown = 30, slow = None, clock = clock):
+        self.max_failures = failures
+        self.window = window
+        self.cooldown = cooldown
+        self.slow = slow
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = None
+        self.trips = 0
+        self._failures = deque()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """ Return True if the view action may be called now. """
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.cooldown:
+                #This call is the trial
+                self.state = HALF_OPEN
+                return True
+            return self.state == CLOSED
+
+    def success(self, duration = 0.0):
+        """ Record a call that didn't raise an exception. """
+        if self.slow is not None and duration > self.slow:
+            self.failure()
+            return
+        if self.state != CLOSED:
+            with self._lock:
+                self.state = CLOSED
+                self.opened_at = None
+                self._failures.clear()
+
+    def failure(self):
+        """ Record an exception or a slow call. """
+        with self._lock:
+            now = self.clock()
+            if self.state == HALF_OPEN:
+                self._open(now)
+                return
+            self._failures.append(now)
+            while self._failures and self._failures[0] <= now - self.window:
+                self._failures.popleft()
+            if self.state == CLOSED and len(self._failures) >= self.max_failures:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self._failures.clear()
+
+    def reset(self):
+        """ Close the breaker and forget all failures. """
+        with self._lock:
+            self.state = CLOSED
+            self.opened_at = None
+            self._failures.clear()
+
+    def info(self):
+        """ Return a dict with the state, the number of recent failures, when it was opened
+            (according to clock) and how many times it has tripped.
+        """
+        with self._lock:
+            return {'state': self.state, 'failures': len(self._failures),
+                    'opened_at': self.opened_at, 'trips': self.trips}
+
+    def __repr__(self): # pragma : no cover
+        klass = self.__class__
+        classname = '%s.%s' % (klass.__module__, klass.__name__)
+        return "<%s %s>" % (classname, self.state)
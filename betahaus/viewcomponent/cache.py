@@ -0,0 +1,393 @@
+""" Caches used while rendering view groups and view actions.
+    None of them are active unless you enable them.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from pyramid.location import lineage
+from zope.interface import implementer
+
+from betahaus.viewcomponent.interfaces import IFragmentCache
+
+
+_marker = object()
+
+PERMISSION_CACHE_ATTR = '_betahaus_viewcomponent_permission_cache'
+PRINCIPALS_ATTR = '_betahaus_viewcomponent_principals'
+RENDER_MEMO_ATTR = '_betahaus_viewcomponent_render_memo'
+
+#True once a permission cache has been attached to any request. Until then,
+#permission checks don't have to look for one.
+permission_cache_used = False
+
+
+class PermissionCache(object):
+    """ Request scoped memo of permission checks.
+        Results are keyed by permission checker, permission and context identity,
+        so the same permission on the same context is only checked once per request.
+        The context itself is kept as well, so a recycled id() won't cause a false hit.
+    """
+    identity_check = True
+
+    def __init__(self):
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, perm_checker, permission, context, request, lineage_index = None):
+        """ Return the cached result or call perm_checker. lineage_index is
+            a LineageIndex for context, if there is one.
+        """
+        key = (perm_checker, permission, self.context_key(context, lineage_index))
+        cached = self._results.get(key)
+        if cached is not None and (cached[0] is context or not self.identity_check):
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        result = perm_checker(permission, context, request)
+        self._results[key] = (context, result)
+        return result
+
+    def context_key(self, context, lineage_index = None):
+        return id(context)
+
+    def clear(self):
+        self._results.clear()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __repr__(self): # pragma : no cover
+        klass = self.__class__
+        classname = '%s.%s' % (klass.__module__, klass.__name__)
+        return "<%s hits=%s misses=%s>" % (classname, self.hits, self.misses)
+
+
+class ACLPermissionCache(PermissionCache):
+    """ Permission cache that shares results between contexts with the same ACLs
+        in their lineage. Only valid when permissions are decided by ACLs,
+        like with Pyramids ACLAuthorizationPolicy. Used for batch rendering
+        when share_permissions is true.
+    """
+    identity_check = False
+
+    def context_key(self, context, lineage_index = None):
+        if lineage_index is not None:
+            return lineage_index.acl_fingerprint
+        return acl_fingerprint(context)
+
+
+def acl_fingerprint(context, nodes = None):
+    """ Return a hashable value representing all ACLs in the lineage of context.
+        Contexts with the same fingerprint get the same result from an ACL
+        based authorization policy, given the same principals.
+        nodes is the lineage of context, if it's already known.
+    """
+    if nodes is None:
+        nodes = lineage(context)
+    acls = []
+    for location in nodes:
+        try:
+            acl = location.__acl__
+        except AttributeError:
+            continue
+        if callable(acl):
+            acl = acl()
+        acls.append(_freeze(acl))
+    return tuple(acls)
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple([_freeze(x) for x in value])
+    try:
+        hash(value)
+    except TypeError:
+        #For instance pyramid.security.ALL_PERMISSIONS, which is a singleton
+        return (value.__class__.__name__, id(value))
+    return value
+
+def get_permission_cache(request):
+    """ Return the PermissionCache attached to request or None. """
+    return getattr(request, PERMISSION_CACHE_ATTR, None)
+
+def set_permission_cache(request, cache):
+    """ Attach cache to request, or remove the current one if cache is None.
+        Returns the previous cache.
+    """
+    global permission_cache_used
+    previous = get_permission_cache(request)
+    if cache is None:
+        if previous is not None:
+            delattr(request, PERMISSION_CACHE_ATTR)
+    else:
+        permission_cache_used = True
+        setattr(request, PERMISSION_CACHE_ATTR, cache)
+    return previous
+
+def enable_permission_cache(request):
+    """ Attach a PermissionCache to request, unless it already has one.
+        Returns the cache so you can inspect hits and misses.
+    """
+    global permission_cache_used
+    cache = get_permission_cache(request)
+    if cache is None:
+        cache = PermissionCache()
+        permission_cache_used = True
+        setattr(request, PERMISSION_CACHE_ATTR, cache)
+    return cache
+
+
+class VisibilityCache(object):
+    """ Permission results shared between requests. Results are kept per
+        principals, ACL fingerprint and context type, so it's only valid when permissions
+        are decided by ACLs, like with Pyramids ACLAuthorizationPolicy.
+        It's a bounded LRU. View groups clear their cache whenever they change.
+    """
+
+    def __init__(self, size = 1000):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, perm_checker, permission, context, request, fingerprint = _marker):
+        """ Return the cached result or call perm_checker. fingerprint is the
+            acl_fingerprint of context if it's already known.
+        """
+        principals = request_principals(request)
+        if principals is None:
+            return perm_checker(permission, context, request)
+        if fingerprint is _marker:
+            fingerprint = acl_fingerprint(context)
+        key = (principals, fingerprint, context.__class__)
+        with self._lock:
+            results = self._entries.pop(key, None)
+            if results is None:
+                results = {}
+            self._entries[key] = results
+            while len(self._entries) > self.size:
+                self._entries.popitem(last = False)
+            try:
+                result = results[(perm_checker, permission)]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                return result
+        result = results[(perm_checker, permission)] = perm_checker(permission, context, request)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self): # pragma : no cover
+        klass = self.__class__
+        classname = '%s.%s' % (klass.__module__, klass.__name__)
+        return "<%s hits=%s misses=%s>" % (classname, self.hits, self.misses)
+
+
+def request_principals(request):
+    """ Return the effective principals of request as a frozenset, or None if the
+        request doesn't have any. They're only looked up once per request.
+    """
+    try:
+        return getattr(request, PRINCIPALS_ATTR)
+    except AttributeError:
+        pass
+    try:
+        principals = frozenset(request.effective_principals)
+    except AttributeError:
+        return None
+    setattr(request, PRINCIPALS_ATTR, principals)
+    return principals
+
+class RenderMemo(object):
+    """ Request scoped memo of rendered view groups and view actions.
+        Results are keyed by what was rendered, the arguments and context identity.
+        Lists and dicts are copied, so changing a result won't change the next one.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, context):
+        """ Return (result, store) like lookup_fragment. key must be hashable,
+            otherwise nothing is stored.
+        """
+        try:
+            key = (key, id(context))
+            cached = self._results.get(key)
+        except TypeError:
+            return _marker, None
+        if cached is not None and cached[0] is context:
+            self.hits += 1
+            return _copy(cached[1]), None
+        self.misses += 1
+        def store(value):
+            self._results[key] = (context, _copy(value))
+        return _marker, store
+
+    def clear(self):
+        self._results.clear()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __repr__(self): # pragma : no cover
+        klass = self.__class__
+        classname = '%s.%s' % (klass.__module__, klass.__name__)
+        return "<%s hits=%s misses=%s>" % (classname, self.hits, self.misses)
+
+
+def _copy(value):
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+def get_render_memo(request):
+    """ Return the RenderMemo attached to request or None. """
+    return getattr(request, RENDER_MEMO_ATTR, None)
+
+def enable_render_memo(request):
+    """ Attach a RenderMemo to request, unless it already has one.
+        Returns the memo so you can inspect hits and misses.
+    """
+    memo = get_render_memo(request)
+    if memo is None:
+        memo = RenderMemo()
+        setattr(request, RENDER_MEMO_ATTR, memo)
+    return memo
+
+
+
+@implementer(IFragmentCache)
+class FragmentCache(object):
+    """ Bounded in-process LRU cache for the output of view actions.
+        Entries are kept in named regions, each with its own size limit.
+        See interfaces.py for documentation.
+    """
+
+    def __init__(self, default_size = 1000, region_sizes = None, clock = time.time):
+        self.default_size = default_size
+        self.region_sizes = dict(region_sizes or {})
+        self.clock = clock
+        self._regions = {}
+        self._stats = {}
+        self._lock = threading.RLock()
+
+    def _region(self, region):
+        try:
+            return self._regions[region]
+        except KeyError:
+            self._stats[region] = {'hits': 0, 'misses': 0, 'evictions': 0}
+            return self._regions.setdefault(region, OrderedDict())
+
+    def get(self, region, key, default = None):
+        with self._lock:
+            entries = self._region(region)
+            stats = self._stats[region]
+            entry = entries.pop(key, None)
+            if entry is None or (entry[0] is not None and entry[0] <= self.clock()):
+                stats['misses'] += 1
+                return default
+            #Reinsert to mark it as most recently used
+            entries[key] = entry
+            stats['hits'] += 1
+            return entry[1]
+
+    def set(self, region, key, value, ttl = None):
+        with self._lock:
+            entries = self._region(region)
+            entries.pop(key, None)
+            expires = None
+            if ttl is not None:
+                expires = self.clock() + ttl
+            entries[key] = (expires, value)
+            max_size = self.region_sizes.get(region, self.default_size)
+            while len(entries) > max_size:
+                entries.popitem(last = False)
+                self._stats[region]['evictions'] += 1
+
+    def invalidate(self, view_action, key = None):
+        region = view_action.kwargs.get('cache_region', 'default')
+        prefix = _action_key(view_action)
+        with self._lock:
+            entries = self._region(region)
+            if key is not None:
+                entries.pop((prefix, key), None)
+                return
+            for k in [x for x in entries if x[0] == prefix]:
+                del entries[k]
+
+    def clear(self, region = None):
+        with self._lock:
+            if region is None:
+                for entries in self._regions.values():
+                    entries.clear()
+            elif region in self._regions:
+                self._regions[region].clear()
+
+    def stats(self, region = None):
+        with self._lock:
+            if region is not None:
+                self._region(region)
+                return dict(self._stats[region], size = len(self._regions[region]))
+            return dict([(name, dict(stats, size = len(self._regions[name])))
+                         for (name, stats) in self._stats.items()])
+
+
+def _action_key(view_action):
+    group = view_action.parent
+    return (group is not None and group.name or None, view_action.name)
+
+def get_fragment_cache(registry):
+    """ Return the fragment cache of registry. A default one will be registered
+        if there isn't any.
+    """
+    cache = registry.queryUtility(IFragmentCache)
+    if cache is None:
+        cache = FragmentCache()
+        registry.registerUtility(cache, IFragmentCache)
+    return cache
+
+def lookup_fragment(view_action, context, request, **kw):
+    """ Return (output, store) for a view action with the cache_key option.
+        output is the cached output, or a marker object if there isn't any.
+        store is a callable that saves new output, or None if nothing
+        should be cached this time.
+    """
+    options = view_action.kwargs
+    key = options['cache_key'](context, request, view_action, **kw)
+    if key is None:
+        return _marker, None
+    registry = getattr(request, 'registry', None)
+    if registry is None:
+        from pyramid.threadlocal import get_current_registry
+        registry = get_current_registry()
+    cache = get_fragment_cache(registry)
+    region = options.get('cache_region', 'default')
+    key = (_action_key(view_action), key)
+    def store(value):
+        cache.set(region, key, value, ttl = options.get('cache_ttl'))
+    return cache.get(region, key, _marker), store
+
+def render_cached(view_action, context, request, **kw):
+    """ Return cached output for view_action if there's any, otherwise call it and store
+        the result. View actions use this when they have the cache_key option.
+    """
+    result, store = lookup_fragment(view_action, context, request, **kw)
+    if result is _marker:
+        result = view_action.callable(context, request, view_action, **kw)
+        if store is not None:
+            store(result)
+    return result
@@ -1,6 +1,8 @@
 import sys
 
 PY3 = sys.version_info[0] == 3
+#Async generators are needed for the asyncio support
+HAS_ASYNC = sys.version_info >= (3, 6)
 
 if PY3: # pragma: no cover
     string_types = str,
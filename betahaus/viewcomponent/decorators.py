@@ -17,6 +17,38 @@ class view_action(object):
         Priority with which the decorated action is rendered
         within the group
 
+    cache_key, cache_ttl, cache_region
+        Store the output in the fragment cache. See IFragmentCache.
+
+    deferred, placeholder
+        Return a placeholder instead of calling it when the group is rendered.
+        It's called by render_deferred(request) later. placeholder is a callable
+        accepting context, request, view action and the key of the placeholder.
+
+    budget, fallback
+        Max number of seconds to wait for the output when the group is rendered.
+        The view action is rendered in the shared thread pool, and fallback
+        (default None) is used if it takes longer. It's reported with the status 'overrun'.
+
+    breaker
+        A CircuitBreaker, see betahaus.viewcomponent.breaker. Exceptions are logged and
+        fallback is returned instead. While the breaker is open the callable isn't called.
+
+    process, project
+        Call it in the shared process pool. The callable must be importable by dotted name.
+        project is a callable accepting the same arguments as the view action callable,
+        it should return picklable versions of (context, request, kw). Without it,
+        context and request are None in the worker. The va argument is a ProcessViewAction
+        with name, title and group. Other options, like cache_key, don't apply.
+
+    version
+        Cheap callable that returns a version of the output. See IViewGroup.etag.
+
+    idempotent
+        Set to False if the output may change when rendered again within a request.
+        The view action and its group won't be reused by a RenderMemo then.
+
+    Any other keyword arguments are passed to the ViewAction.
     """
     def __init__(self, group_name, action_name, priority=None, **kwargs):
         self.group_name = group_name
@@ -0,0 +1,62 @@
+""" Deferred rendering of slow view actions.
+    View actions with the option deferred=True are not called when the group is
+    rendered. A placeholder is returned in their place, and the view action is
+    remembered on the request. Call render_deferred(request) later, for instance
+    at the end of a streamed response, to get the output for each placeholder.
+"""
+from betahaus.viewcomponent import pool
+
+
+DEFERRED_ATTR = '_betahaus_viewcomponent_deferred'
+
+
+def default_placeholder(context, request, va, key):
+    return u'<div data-deferred="%s"></div>' % key
+
+
+class _Deferred(object):
+    __slots__ = ('count', 'pending')
+
+    def __init__(self):
+        self.count = 0
+        self.pending = []
+
+
+def defer(view_action, context, request, kw):
+    """ Remember view_action to be rendered by render_deferred and return its placeholder.
+        Predicates must already have been checked.
+    """
+    deferred = getattr(request, DEFERRED_ATTR, None)
+    if deferred is None:
+        deferred = _Deferred()
+        setattr(request, DEFERRED_ATTR, deferred)
+    key = u'deferred-%s' % deferred.count
+    deferred.count += 1
+    deferred.pending.append((key, view_action, context, kw))
+    placeholder = view_action.kwargs.get('placeholder', default_placeholder)
+    return placeholder(context, request, view_action, key)
+
+def pending_deferred(request):
+    """ Return the number of deferred view actions that haven't been rendered. """
+    deferred = getattr(request, DEFERRED_ATTR, None)
+    return deferred is not None and len(deferred.pending) or 0
+
+def render_deferred(request, concurrent = False):
+    """ Render all view actions deferred during this request and return a list of
+        (key, output) in the order they were deferred. key is the same one that was passed
+        to the placeholder. View actions deferred while rendering are rendered as well.
+        If concurrent is true, they're rendered in the shared thread pool.
+    """
+    results = []
+    deferred = getattr(request, DEFERRED_ATTR, None)
+    while deferred is not None and deferred.pending:
+        batch = deferred.pending
+        deferred.pending = []
+        if concurrent and not pool.in_worker():
+            batch = [(key, pool.submit(va.render, context, request, **kw))
+                     for (key, va, context, kw) in batch]
+            results.extend([(key, future.result()) for (key, future) in batch])
+        else:
+            for (key, va, context, kw) in batch:
+                results.append((key, va.render(context, request, **kw)))
+    return results
@@ -0,0 +1,22 @@
+""" Coroutine view actions, only importable on Python 3.6 or later. """
+import asyncio
+
+
+async def sleeping_action(context, request, va, **kw):
+    await asyncio.sleep(va.kwargs.get('delay', 0))
+    return va.name
+
+async def waiting_action(context, request, va, **kw):
+    """ Returns only when the event passed as keyword 'event' is set. """
+    await asyncio.wait_for(kw['event'].wait(), 2)
+    return va.name
+
+async def setting_action(context, request, va, **kw):
+    kw['event'].set()
+    return va.name
+
+async def empty_action(context, request, va, **kw):
+    return ''
+
+async def failing_action(context, request, va, **kw):
+    raise ValueError(va.name)
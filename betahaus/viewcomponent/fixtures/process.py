@@ -0,0 +1,15 @@
+""" View actions that are rendered in the process pool. They must be importable. """
+import os
+
+
+def square(context, request, va, number = 0, **kw):
+    return u"%s:%s" % (va.name, number * number)
+
+def pid(context, request, va, **kw):
+    return os.getpid()
+
+def fails(context, request, va, **kw):
+    raise ValueError(va.name)
+
+def project(context, request, va, **kw):
+    return context.__name__, None, {'number': kw.get('number', 2)}
@@ -30,25 +30,57 @@ class IViewGroup(Interface):
         by assigning a list to it. Any keys that exist but aren't in the assigned list
         will be added last.""")
 
+    render_plan = Attribute("""
+        A tuple of (name, view_action, predicates) in the set order. It's what the
+        as_* methods iterate over. It's rebuilt after any change to the group or
+        when an attribute of a contained view action is set,
+        so don't change the list returned by order in place - assign a new one instead.""")
+
     perm_checker = Attribute("""
         Permission checker, usually Pyramids has_permission.
         You can add any other callable here if you want, but it must accept the same
         arguments as Pyramids version, i.e. permission, context, request.
         See pyramid.security.has_permission for more info.""")
 
-    def __init__(name = None, perm_checker = None):
+    concurrent = Attribute("""
+        If true, the view actions of this group are rendered in a shared thread pool.
+        The result is still assembled in order. Predicates like permission are checked
+        before anything is started, in the calling thread. Pyramids threadlocals are
+        the same in the worker threads. Groups rendered by a view action that is already
+        running in the pool are rendered in that thread instead.""")
+
+    visibility_cache = Attribute("""
+        A VisibilityCache (see betahaus.viewcomponent.cache) or None. It keeps permission
+        results between requests, per effective principals, ACLs in the lineage and type
+        of context. Only use it with ACL based authorization. It's cleared whenever
+        the group changes.""")
+
+    idempotent = Attribute("""
+        Set this to False if the output may differ when the group is rendered again
+        within the same request. Then it's never reused by a RenderMemo.""")
+
+    memoizable = Attribute("""
+        True if idempotent is true and none of the contained view actions have
+        the option idempotent=False.""")
+
+    uses_processes = Attribute("""
+        True if any view action has the process option. Those are started in the shared
+        process pool before anything else is rendered.""")
+
+    def __init__(name = None, perm_checker = None, concurrent = False, visibility_cache = None):
         """ Initialize, accepts permission checker as argument which will default
             to Pyramids version if None is supplied.
         """
     
-    def __call__(context, request, as_type = None, spacer = "", empty_val = _marker, **kw):
+    def __call__(context, request, as_type = None, spacer = "", empty_val = _marker, concurrent = None, **kw):
         """ Return a list with the output of each contained view action.
             Any keywords will be passed along to the view action as well.
             
             ``as_type``
             
-                Defaults to string output, but could be 'list', 'dict' or 'generator'.
-                See each method (as_list, as_dict, as_generator) for more info.
+                Defaults to string output, but could be 'list', 'dict', 'generator', 'stream', 'first',
+                'bytes' or 'buffers'. See each method (as_list, as_dict, as_generator, as_stream,
+                as_first, as_bytes, as_buffers) for more info.
             
             ``spacer``
             
@@ -61,6 +93,52 @@ class IViewGroup(Interface):
             
                 If this is specified, empty values (None or "") won't be removed from
                 the result, but replaced with this value.
+
+            ``concurrent``
+
+                Render the view actions in the shared thread pool. None means
+                that the concurrent attribute of the view group decides.
+        """
+
+    frozen = Attribute("True if the group has been frozen. See freeze.")
+
+    def freeze():
+        """ Make the group immutable. The render plan is compiled right away.
+            Any attempt to change the group or set an attribute
+            of a contained view action after this raises FrozenViewGroupError.
+            order is a tuple from then on.
+        """
+
+    def render_many(contexts, request, as_type = None, share_permissions = False, **kw):
+        """ Render this group for each context and return a list with the results,
+            in the same order as contexts. All other arguments work the same as when
+            calling the group.
+
+            Interface filtering is done once per kind of context. If share_permissions
+            is true, permission checks are shared between contexts that have the same ACLs
+            in their lineage. Only turn it on with ACL based authorization,
+            a perm_checker that looks at anything else would get the wrong results.
+            It can't be combined with as_type 'generator' or 'stream', since they're
+            evaluated after this method returns. That raises ValueError.
+        """
+
+    def check_permission(permission, context, request, lineage_index = None):
+        """ Check permission with perm_checker. If the group has a visibility_cache,
+            it's used. Otherwise, if the request has a PermissionCache
+            attached (see betahaus.viewcomponent.cache), the result will be reused
+            for the rest of that request. lineage_index is a LineageIndex for context,
+            if there is one.
+        """
+
+    def etag(context, request, **kw):
+        """ Return a validator for the output, suitable as an ETag, without rendering anything.
+            Each view action that would be rendered must have the option version:
+            a callable accepting the same arguments as the view action callable.
+            It should be cheap and return something hashable with a stable repr,
+            like a modification time or revision number, that changes when the output does.
+            Returns None if any of them doesn't have a version or returns None.
+            It's None as well if any of them has the budget or breaker option, since
+            the fallback may be rendered instead.
         """
 
     def __getitem__(key):
@@ -88,6 +166,13 @@ class IViewGroup(Interface):
             >>> view_group['name'] = view_action
         """
 
+    def update(view_actions):
+        """ Add several ViewAction objects, either a dict or any iterable with view actions.
+            View actions with priority are placed in the order when it's needed,
+            so adding lots of them at once is fast. The result is the same as adding
+            them one at a time.
+        """
+
     def get(key, default=None):
         """ Same as dict get """
 
@@ -100,18 +185,75 @@ class IViewGroup(Interface):
     def items():
         """ Same as normal dict, but ordered. """
 
-    def as_generator(context, request, empty_val = _marker, **kw):
+    def as_generator(context, request, empty_val = _marker, concurrent = None, **kw):
         """ Return a generator with the output.
         """
 
-    def as_dict(context, request, empty_val = _marker, **kw):
+    def as_dict(context, request, empty_val = _marker, concurrent = None, **kw):
         """ Return all of the output as a dict with the view action name as key.
         """
 
-    def as_list(context, request, empty_val = _marker, **kw):
+    def as_list(context, request, empty_val = _marker, concurrent = None, limit = None, **kw):
         """ Return all the output in the format of a list instead.
+
+            ``limit``
+
+                Stop after this many non-empty results. The view actions after that
+                won't be checked or called. (Unless the group is rendered concurrently,
+                then all allowed view actions are started.)
+        """
+
+    def as_first(context, request, empty_val = _marker, concurrent = None, **kw):
+        """ Return the first non-empty output. The view actions after that won't
+            be checked or called. Returns empty_val if there's no output,
+            or None if empty_val isn't specified.
         """
 
+    def as_stream(context, request, spacer = "", empty_val = _marker, concurrent = None,
+                  encoding = 'utf-8', **kw):
+        """ Return a generator that yields encoded output as soon as each view action
+            has rendered, with the encoded spacer in between. Output that already is bytes
+            is passed along as it is. Suitable as response.app_iter, for instance:
+
+            >>> response.app_iter = view_group.as_stream(context, request)
+        """
+
+    def as_bytes(context, request, spacer = "", empty_val = _marker, concurrent = None,
+                 encoding = 'utf-8', **kw):
+        """ Return all output as a single bytes object. Text is encoded with encoding,
+            bytes and other buffers like memoryview are joined as they are, so nothing
+            is joined twice.
+        """
+
+    def as_buffers(context, request, spacer = "", empty_val = _marker, concurrent = None,
+                   encoding = 'utf-8', **kw):
+        """ Return a list with the same parts as_bytes would join: encoded text, spacers and
+            buffers that aren't copied. Suitable as response.app_iter if the output is bytes,
+            WSGI servers don't have to accept memoryview.
+        """
+
+    def write_to(fileobj, context, request, spacer = "", empty_val = _marker, concurrent = None,
+                 encoding = 'utf-8', **kw):
+        """ Write the same thing as as_stream would yield to a file-like object.
+            Returns the number of bytes written.
+        """
+
+
+class IAsyncViewGroup(Interface):
+    """ Async render methods of view groups. Only implemented on Python 3.6 or later.
+        View actions may have coroutine functions as callables, they will be awaited
+        concurrently. Regular callables are called as usual.
+    """
+
+    def as_generator_async(context, request, empty_val = _marker, **kw):
+        """ Return an async generator with the output. """
+
+    def as_dict_async(context, request, empty_val = _marker, **kw):
+        """ Coroutine, same as as_dict. """
+
+    def as_list_async(context, request, empty_val = _marker, **kw):
+        """ Coroutine, same as as_list. """
+
 
 class IViewAction(Interface):
     """ ViewAction objects ment to populate ViewGroups. They're created on the fly through the use of the @view_action
@@ -128,11 +270,73 @@ class IViewAction(Interface):
     permission = Attribute("Require this permission for any result to be returned.")
     interface = Attribute("Require context to have this interface for any result to be returned.")
     containment = Attribute("Require context to be within something that implements this interface. (Any parent may implement it)")
-    kwargs = Attribute("Any non-standard kwargs passed to the decorator will be stored in this dict.")
+    kwargs = Attribute("""
+        Any non-standard kwargs passed to the decorator will be stored in this dict.
+        They're read when the render plan of the group is compiled, so pass them when
+        the view action is created rather than changing the dict afterwards.""")
     parent = Attribute("The ViewGroup the instantiated object is a part of.")
+    idempotent = Attribute("""
+        False if the option idempotent=False was passed, which means the output is never reused
+        by a RenderMemo, neither for this view action nor its group.""")
+    direct = Attribute("""
+        True if the callable can be called without going through render, i.e. there are
+        no options like cache_key or deferred.""")
+    predicates = Attribute("""
+        Tuple of checks for interface, permission and containment that this view action has.
+        Each is called with view_action, context, request and a LineageIndex for the context
+        and must return something true
+        for the callable to be executed.""")
 
     def __init__(_callable, name, title = u"", permission = None, interface = None, containment = None, **kw):
         """ Instatiate. """
 
     def __call__(context, request, **kw):
         """ Return the result of this view action, if allowed. """
+
+    def render(context, request, **kw):
+        """ Return the result of the callable without checking predicates.
+            Cached output is returned instead if the cache_key option is used.
+            See IFragmentCache. With the process option, the callable is called
+            in the shared process pool.
+        """
+
+
+class IFragmentCache(Interface):
+    """ Utility that stores the output of view actions that have the cache_key option.
+        Entries are stored in regions, each one an LRU with its own size limit.
+
+        The view action options are:
+
+        ``cache_key``
+            A callable accepting the same arguments as the view action callable.
+            It should return a hashable key that identifies the output, or None
+            if the output shouldn't be cached this time.
+
+        ``cache_ttl``
+            Seconds until a stored fragment expires. Defaults to never.
+
+        ``cache_region``
+            Name of the region to store fragments in. Defaults to 'default'.
+    """
+    default_size = Attribute("Max number of entries in regions not listed in region_sizes.")
+    region_sizes = Attribute("Dict with region name as key and the max number of entries as value.")
+
+    def get(region, key, default = None):
+        """ Return a stored value or default if it's missing or expired. """
+
+    def set(region, key, value, ttl = None):
+        """ Store value. The least recently used entry is evicted if the region is full. """
+
+    def invalidate(view_action, key = None):
+        """ Remove all stored output of a view action, or only the output stored
+            for a specific key if it's specified. None is never stored as a key,
+            see cache_key.
+        """
+
+    def clear(region = None):
+        """ Remove everything, or everything within a region. """
+
+    def stats(region = None):
+        """ Return a dict with hits, misses, evictions and size for a region.
+            If region isn't specified, a dict with all regions is returned.
+        """
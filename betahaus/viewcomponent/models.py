@@ -1,68 +1,309 @@
+import hashlib
 import logging
+import threading
+from bisect import bisect_right
 
 from zope.interface import implementer
-from pyramid.security import has_permission
-from pyramid.traversal import find_interface
+from zope.interface import providedBy
+from zope.interface.interfaces import IInterface
+from pyramid.location import lineage
 
+from betahaus.viewcomponent.cache import ACLPermissionCache
+from betahaus.viewcomponent.cache import VisibilityCache
+from betahaus.viewcomponent.cache import PERMISSION_CACHE_ATTR
+from betahaus.viewcomponent.cache import acl_fingerprint
+from betahaus.viewcomponent.cache import set_permission_cache
+from betahaus.viewcomponent.cache import render_cached
 from betahaus.viewcomponent.interfaces import IViewAction
 from betahaus.viewcomponent.interfaces import IViewGroup
+from betahaus.viewcomponent.compat import HAS_ASYNC
+from betahaus.viewcomponent.compat import PY3
 from betahaus.viewcomponent.compat import string_types
-from pyramid.threadlocal import get_current_registry
+from betahaus.viewcomponent.compat import text_type
+from betahaus.viewcomponent.deferred import defer
+from betahaus.viewcomponent import cache as cache_module
+from betahaus.viewcomponent import pool
+from betahaus.viewcomponent.stats import clock
+from betahaus.viewcomponent.stats import render_hooks
+from betahaus.viewcomponent.stats import report
 
 logger = logging.getLogger(__name__)
 
 _marker = object()
 _empty_vals = ('', None)
+_dispatch_cache_size = 100
+#Output types that join the output themselves and need the spacer
+_spacer_types = ('stream', 'bytes', 'buffers')
+#Output types that are rendered after they're returned
+_lazy_types = ('generator', 'stream')
+#Empty output for as_bytes and as_buffers. memoryview(b'') is equal to b'' as well.
+_empty_buffers = ('', b'', None)
+_view_group_cache_attr = '_betahaus_viewcomponent_groups'
+#View action options that change how the callable is called
+_render_options = ('cache_key', 'deferred', 'budget', 'breaker', 'process')
+#View action options that may render the fallback instead, see ViewGroup.etag
+_fallback_options = ('budget', 'breaker')
+#See _default_perm_checker
+_has_permission = None
+#Held while pending keys are placed in the order, see ViewGroup._flush
+_flush_lock = threading.Lock()
+
+if HAS_ASYNC: # pragma: no cover
+    from betahaus.viewcomponent.aio import AsyncViewGroupMixin
+else: # pragma: no cover
+    AsyncViewGroupMixin = object
+
+
+class FrozenViewGroupError(TypeError):
+    """ Raised when a frozen ViewGroup is changed. """
+
+
+class _EmptyKwargs(dict):
+    """ Immutable empty dict, shared by all view actions without extra options. """
+    __slots__ = ()
+
+    def _immutable(self, *args, **kw):
+        raise TypeError("View actions without options share an immutable kwargs dict. "
+                        "Pass the options when the view action is created instead.")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _immutable
+
+_empty_kwargs = _EmptyKwargs()
 
 
 @implementer(IViewGroup)
-class ViewGroup(object):
+class ViewGroup(AsyncViewGroupMixin):
     """ Named utility for views. Behaves much like an ordered dict.
         See interfaces.py for documentation.
     """
-    
-    def __init__(self, name = None, perm_checker = None):
+    __slots__ = ('name', 'perm_checker', 'concurrent', 'visibility_cache', 'idempotent', '_order', '_pending',
+                 '_data', '_interface_index', '_plan', '_dispatch', '_frozen', '_memoizable', '_processes',
+                 '__weakref__')
+
+    def __init__(self, name = None, perm_checker = None, concurrent = False, visibility_cache = None):
         self.name = name
         if perm_checker is None:
-            perm_checker = has_permission
+            perm_checker = _default_perm_checker()
         self.perm_checker = perm_checker
+        self.concurrent = concurrent
+        self.visibility_cache = visibility_cache
+        self.idempotent = True
         self._order = []
+        self._pending = []
         self._data = {}
+        self._interface_index = {}
+        self._plan = None
+        self._dispatch = {}
+        self._frozen = False
+        self._memoizable = None
+        self._processes = None
     
     def __call__(self, context, request,
-                 as_type = None, spacer = "", empty_val = _marker, **kw):
+                 as_type = None, spacer = "", empty_val = _marker, concurrent = None, **kw):
         if as_type is None:
-            return spacer.join([x for x in self.as_generator(context, request, empty_val = empty_val, **kw)])
+            return spacer.join(self.as_list(context, request, empty_val = empty_val,
+                                            concurrent = concurrent, **kw))
         try:
             type_method = getattr(self, 'as_%s' % as_type)
         except AttributeError:
             raise ValueError("as_type must be a valid output type or None, was: %r" % as_type)
-        return type_method(context, request, empty_val = empty_val, **kw)
+        if as_type in _spacer_types:
+            kw['spacer'] = spacer
+        return type_method(context, request, empty_val = empty_val, concurrent = concurrent, **kw)
+
+    def render_many(self, contexts, request, as_type = None, share_permissions = False, **kw):
+        previous = None
+        if share_permissions:
+            if as_type in _lazy_types:
+                raise ValueError("share_permissions can't be used with as_type %r, since it's "
+                                 "rendered after render_many has returned." % as_type)
+            previous = set_permission_cache(request, ACLPermissionCache())
+        try:
+            return [self(context, request, as_type = as_type, **kw) for context in contexts]
+        finally:
+            if share_permissions:
+                set_permission_cache(request, previous)
+
+    def check_permission(self, permission, context, request, lineage_index = None):
+        if self.visibility_cache is not None:
+            fingerprint = _marker
+            if lineage_index is not None:
+                fingerprint = lineage_index.acl_fingerprint
+            return self.visibility_cache.check(self.perm_checker, permission, context, request, fingerprint)
+        if not cache_module.permission_cache_used:
+            return self.perm_checker(permission, context, request)
+        cache = getattr(request, PERMISSION_CACHE_ATTR, None)
+        if cache is None:
+            return self.perm_checker(permission, context, request)
+        return cache.check(self.perm_checker, permission, context, request, lineage_index)
+
+    def _uncached_perm_checker(self, request):
+        """ Return perm_checker if there are no caches to consult for request,
+            so permission checks can go straight to it. Otherwise None.
+        """
+        if self.visibility_cache is not None:
+            return None
+        if cache_module.permission_cache_used and getattr(request, PERMISSION_CACHE_ATTR, None) is not None:
+            return None
+        return self.perm_checker
+
+    def etag(self, context, request, **kw):
+        allowed = []
+        for name, va, mode in self._iter_allowed(context, request, reported = False):
+            if va is None:
+                #Not allowed, it's left out of the validator
+                continue
+            version = va.kwargs.get('version')
+            if version is None:
+                return
+            for option in _fallback_options:
+                if va.kwargs.get(option) is not None:
+                    #The output may be the fallback, which the version doesn't cover
+                    return
+            version = version(context, request, va, **kw)
+            if version is None:
+                return
+            allowed.append((name, version))
+        return hashlib.sha1(repr((self.name, allowed)).encode('utf-8')).hexdigest()
 
     def __getitem__(self, key):
         return self._data[key]
 
     def __setitem__(self, key, value):
+        self._check_frozen()
         assert isinstance(value, ViewAction)
         value.parent = self
-        if value.priority is not None:
-            if key in self.order:
-                self.order.remove(key)
-            index = len(self)
-            for va in reversed(self.values()):
-                if va.priority is not None and va.priority <= value.priority:
-                    break
-                index -= 1
-            self.order.insert(index, key)
-        else:
-            if key not in self.order:
+        if key in self._data:
+            if value.priority is not None:
+                if key in self.order:
+                    self.order.remove(key)
+                index = len(self)
+                for va in reversed(self.values()):
+                    if va.priority is not None and va.priority <= value.priority:
+                        break
+                    index -= 1
+                self.order.insert(index, key)
+            elif key not in self.order:
                 self.order.append(key)
+            self._unindex(key, self._data[key])
+        elif value.priority is not None or self._pending:
+            #Placed when the order is needed, see _flush
+            self._pending.append(key)
+        else:
+            self._order.append(key)
         self._data[key] = value
+        self._index(key, value)
+        self._changed()
+
+    def update(self, view_actions):
+        """ Add several view actions, either a dict or an iterable of view actions. """
+        if isinstance(view_actions, dict):
+            view_actions = view_actions.values()
+        for va in view_actions:
+            self.add(va)
+
+    def _flush(self):
+        """ Place new keys in the order. They're kept in _pending until the order is needed,
+            so adding many view actions with priority isn't quadratic. The result is the same
+            as if they had been inserted one at a time: after the last view action that has
+            a priority less than or equal to theirs, or first if there isn't one.
+
+            This may happen during the first render, so it's done under a lock and the new
+            order is in place before _pending is emptied. Other threads either wait
+            or see the complete order.
+        """
+        with _flush_lock:
+            pending = self._pending
+            if pending:
+                order = self._place(list(self._order), pending)
+                self._order = order
+                self._pending = []
+                self._plan = None
+                self._dispatch = {}
+
+    def _place(self, order, pending):
+        priorities = []
+        prioritized = []
+        for name in order:
+            priority = self._data[name].priority
+            if priority is not None:
+                priorities.append(priority)
+                prioritized.append(name)
+        if priorities != sorted(priorities):
+            #The order has been set by hand, so insert them one at a time.
+            for key in pending:
+                self._insert(order, key)
+            return order
+        #Keys are linked to the key after them, None is the start
+        following = dict(zip([None] + order, order))
+        last = None
+        if order:
+            last = order[-1]
+        for key in pending:
+            priority = self._data[key].priority
+            if priority is None:
+                following[last] = key
+                last = key
+                continue
+            i = bisect_right(priorities, priority)
+            anchor = None
+            if i:
+                anchor = prioritized[i - 1]
+            priorities.insert(i, priority)
+            prioritized.insert(i, key)
+            after = following.get(anchor)
+            following[anchor] = key
+            if after is None:
+                last = key
+            else:
+                following[key] = after
+        order = []
+        key = following.get(None)
+        while key is not None:
+            order.append(key)
+            key = following.get(key)
+        return order
+
+    def _insert(self, order, key):
+        priority = self._data[key].priority
+        if priority is None:
+            order.append(key)
+            return
+        index = len(order)
+        for name in reversed(order):
+            va = self._data[name]
+            if va.priority is not None and va.priority <= priority:
+                break
+            index -= 1
+        order.insert(index, key)
 
     def __delitem__(self, key):
-        del self._data[key]
+        self._check_frozen()
+        if self._pending:
+            self._flush()
+        self._unindex(key, self._data.pop(key))
         if key in self._order:
             self._order.remove(key)
+        self._changed()
+
+    def _index(self, key, va):
+        self._interface_index.setdefault(va.interface or None, set()).add(key)
+
+    def _unindex(self, key, va):
+        iface = va.interface or None
+        names = self._interface_index.get(iface)
+        if names is not None:
+            names.discard(key)
+            if not names:
+                del self._interface_index[iface]
+
+    def _changed(self):
+        self._plan = None
+        self._dispatch = {}
+        self._memoizable = None
+        self._processes = None
+        if self.visibility_cache is not None:
+            self.visibility_cache.clear()
 
     def __len__(self):
         return len(self._data)
@@ -72,10 +313,13 @@ class ViewGroup(object):
 
     @property
     def order(self):
+        if self._pending:
+            self._flush()
         return self._order
 
     @order.setter
     def order(self, values):
+        self._check_frozen()
         handle_keys = set(self.order)
         values = [unicode(x) for x in values]
         bad_keys = set()
@@ -93,6 +337,53 @@ class ViewGroup(object):
             logger.warning("The following keys were appended at the end since they existed: '%s'" % "', '".join(handle_keys))
             new_order.extend(handle_keys)
         self._order = new_order
+        self._changed()
+
+    @property
+    def memoizable(self):
+        """ True if the output may be reused within a request, i.e. neither the group nor
+            any view action in it has been marked as not idempotent.
+        """
+        if not self.idempotent:
+            return False
+        if self._memoizable is None:
+            self._memoizable = not [x for x in self._data.values() if not x.idempotent]
+        return self._memoizable
+
+    @property
+    def uses_processes(self):
+        """ True if any view action has the process option. """
+        if self._processes is None:
+            self._processes = bool([x for x in self._data.values() if x.kwargs.get('process')])
+        return self._processes
+
+    @property
+    def frozen(self):
+        return self._frozen
+
+    def freeze(self):
+        self._order = tuple(self.order)
+        self._frozen = True
+        self._changed()
+        #Compile it right away
+        self.render_plan
+
+    def _check_frozen(self):
+        if self._frozen:
+            raise FrozenViewGroupError("The view group %r is frozen and can't be changed. "
+                                       "Make all changes before the configuration is committed." % self.name)
+
+    @property
+    def render_plan(self):
+        """ A tuple with (name, view_action, predicates) in the correct order.
+            It's compiled the first time it's needed and discarded whenever
+            the group changes.
+        """
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = tuple([(name, self._data[name], self._data[name].predicates)
+                                       for name in self.order])
+        return plan
 
     def add(self, view_action):
         self[view_action.name] = view_action
@@ -109,28 +400,235 @@ class ViewGroup(object):
     def items(self):
         return [(name, self[name]) for name in self.order]
 
-    def as_generator(self, context, request, empty_val = _marker, **kw):
-        for x in self.values():
-            res = x(context, request, **kw)
+    def _dispatch_plan(self, context):
+        """ Return the render plan entries that may match context, and the whole plan
+            where the entries that can't match have None instead of predicates.
+            The interface index is consulted once per kind of context,
+            so view actions bound to other interfaces are never looked at.
+            Entries are (name, view_action, predicates, mode) where mode is how
+            _iter_output should render it, see _render_mode.
+        """
+        spec = providedBy(context)
+        try:
+            return self._dispatch[spec]
+        except KeyError:
+            pass
+        names = set(self._interface_index.get(None, ()))
+        for iface in spec.flattened():
+            names.update(self._interface_index.get(iface, ()))
+        candidates = []
+        everything = []
+        for name, va, predicates in self.render_plan:
+            if name in names:
+                entry = (name, va, tuple([x for x in predicates if x is not _interface_predicate]),
+                         _render_mode(va))
+                candidates.append(entry)
+                everything.append(entry)
+            else:
+                everything.append((name, va, None, None))
+        if len(self._dispatch) >= _dispatch_cache_size:
+            self._dispatch.clear()
+        result = self._dispatch[spec] = (tuple(candidates), tuple(everything))
+        return result
+
+    def _iter_allowed(self, context, request, include_skipped = False, reported = True):
+        """ Yield (name, view_action, mode) for each view action according to the render plan.
+            view_action is None if it isn't allowed for this context and request.
+            View actions that can't match the context are only included
+            if include_skipped is true, but they're always reported to render hooks.
+            Nothing is reported if reported is false, for checks that don't render anything.
+        """
+        candidates, everything = self._dispatch_plan(context)
+        lineage_index = LineageIndex(context)
+        hooks = reported and render_hooks
+        perm_checker = self._uncached_perm_checker(request)
+        entries = candidates
+        if include_skipped or hooks:
+            entries = everything
+        for name, va, predicates, mode in entries:
+            if predicates is None:
+                if hooks:
+                    report(va, 'interface')
+                if include_skipped:
+                    yield name, None, None
+                continue
+            if hooks:
+                start = clock()
+                if mode == 'direct':
+                    #Go through render so it's reported
+                    mode = 'render'
+            for predicate in predicates:
+                if predicate is _permission_predicate and perm_checker is not None:
+                    allowed = perm_checker(va.permission, context, request)
+                else:
+                    allowed = predicate(va, context, request, lineage_index)
+                if not allowed:
+                    if hooks:
+                        report(va, _predicate_status[predicate], clock() - start)
+                    yield name, None, None
+                    break
+            else:
+                yield name, va, mode
+
+    def _iter_output(self, context, request, kw, include_skipped = False, concurrent = None,
+                     prestart = True):
+        """ Yield (name, output) for each view action in order.
+            If concurrent is true, all allowed view actions are started in the
+            shared thread pool first. Predicates are always checked in this thread.
+            Groups rendered from a task in the pool are never rendered concurrently.
+            View actions with the process option are started before anything else
+            is rendered, unless prestart is false. It's false when the caller may stop
+            early, so nothing after that is checked or started.
+        """
+        if concurrent is None:
+            concurrent = self.concurrent
+        if concurrent and pool.in_worker():
+            #Rendered from within the pool, waiting for queued work could deadlock
+            concurrent = False
+        if not concurrent:
+            allowed = self._iter_allowed(context, request, include_skipped)
+            started = {}
+            if prestart and self.uses_processes:
+                #Start them first so they run while the rest is rendered
+                allowed = list(allowed)
+                started = dict([(name, _ProcessCall(va, context, request, kw))
+                                for (name, va, mode) in allowed if mode == 'process'])
+            for name, va, mode in allowed:
+                if va is None:
+                    yield name, None
+                elif mode == 'direct':
+                    yield name, va.callable(context, request, va, **kw)
+                elif mode == 'render':
+                    yield name, va.render(context, request, **kw)
+                elif mode == 'deferred':
+                    yield name, defer(va, context, request, kw)
+                elif mode == 'process':
+                    call = started.get(name)
+                    if call is None:
+                        call = _ProcessCall(va, context, request, kw)
+                    yield name, call.result()
+                else:
+                    yield name, _Budgeted(va, context, request, kw).result()
+            return
+        futures = []
+        for name, va, mode in self._iter_allowed(context, request, include_skipped):
+            if va is not None:
+                if mode == 'deferred':
+                    #Keep the placeholder as it is
+                    futures.append((name, _Placeholder(defer(va, context, request, kw))))
+                    continue
+                if mode == 'process':
+                    futures.append((name, _ProcessCall(va, context, request, kw)))
+                    continue
+                if mode == 'budget':
+                    futures.append((name, _Budgeted(va, context, request, kw)))
+                    continue
+                va = pool.submit(va.render, context, request, **kw)
+            futures.append((name, va))
+        for name, future in futures:
+            if future is None:
+                yield name, None
+            else:
+                yield name, future.result()
+
+    def as_generator(self, context, request, empty_val = _marker, concurrent = None, **kw):
+        for (k, res) in self._iter_output(context, request, kw, empty_val is not _marker, concurrent):
             if res in _empty_vals:
-                if empty_val != _marker:
+                if empty_val is not _marker:
                     yield empty_val
             else:
                 yield res
 
-    def as_dict(self, context, request, empty_val = _marker, **kw):
+    def as_dict(self, context, request, empty_val = _marker, concurrent = None, **kw):
         va_output = {}
-        for (k, v) in self.items():
-            res = v(context, request, **kw)
+        for (k, res) in self._iter_output(context, request, kw, empty_val is not _marker, concurrent):
             if res in _empty_vals:
-                if empty_val != _marker:
+                if empty_val is not _marker:
                     va_output[k] = empty_val
             else:
                 va_output[k] = res
         return va_output
 
-    def as_list(self, context, request, empty_val = _marker, **kw):
-        return list(self.as_generator(context, request, empty_val = empty_val, **kw))
+    def as_list(self, context, request, empty_val = _marker, concurrent = None, limit = None, **kw):
+        result = []
+        if limit is None:
+            for (k, res) in self._iter_output(context, request, kw, empty_val is not _marker, concurrent):
+                if res in _empty_vals:
+                    if empty_val is not _marker:
+                        result.append(empty_val)
+                else:
+                    result.append(res)
+            return result
+        if limit < 1:
+            return result
+        output = self._iter_output(context, request, kw, empty_val is not _marker, concurrent, False)
+        try:
+            for (k, res) in output:
+                if res in _empty_vals:
+                    if empty_val is not _marker:
+                        result.append(empty_val)
+                    continue
+                result.append(res)
+                limit -= 1
+                if not limit:
+                    break
+        finally:
+            output.close()
+        return result
+
+    def as_first(self, context, request, empty_val = _marker, concurrent = None, **kw):
+        output = self._iter_output(context, request, kw, False, concurrent, False)
+        try:
+            for (k, res) in output:
+                if res not in _empty_vals:
+                    return res
+        finally:
+            output.close()
+        if empty_val is not _marker:
+            return empty_val
+
+    def as_stream(self, context, request, spacer = "", empty_val = _marker, concurrent = None,
+                  encoding = 'utf-8', **kw):
+        spacer = _encode(spacer, encoding)
+        first = True
+        for res in self.as_generator(context, request, empty_val = empty_val, concurrent = concurrent, **kw):
+            if first:
+                first = False
+            elif spacer:
+                yield spacer
+            yield _encode(res, encoding)
+
+    def as_buffers(self, context, request, spacer = "", empty_val = _marker, concurrent = None,
+                   encoding = 'utf-8', **kw):
+        spacer = _buffer(spacer, encoding)
+        if empty_val is not _marker:
+            empty_val = _buffer(empty_val, encoding)
+        buffers = []
+        for (k, res) in self._iter_output(context, request, kw, empty_val is not _marker, concurrent):
+            if res in _empty_buffers:
+                if empty_val is _marker:
+                    continue
+                res = empty_val
+            else:
+                res = _buffer(res, encoding)
+            if buffers and spacer:
+                buffers.append(spacer)
+            buffers.append(res)
+        return buffers
+
+    def as_bytes(self, context, request, spacer = "", empty_val = _marker, concurrent = None,
+                 encoding = 'utf-8', **kw):
+        return b''.join(self.as_buffers(context, request, spacer = spacer, empty_val = empty_val,
+                                        concurrent = concurrent, encoding = encoding, **kw))
+
+    def write_to(self, fileobj, context, request, spacer = "", empty_val = _marker, concurrent = None,
+                 encoding = 'utf-8', **kw):
+        written = 0
+        for chunk in self.as_stream(context, request, spacer = spacer, empty_val = empty_val,
+                                    concurrent = concurrent, encoding = encoding, **kw):
+            fileobj.write(chunk)
+            written += len(chunk)
+        return written
 
     def __repr__(self): # pragma : no cover
         klass = self.__class__
@@ -140,28 +638,142 @@ class ViewGroup(object):
 
 @implementer(IViewAction)
 class ViewAction(object):
+    __slots__ = ('callable', 'name', 'title', 'permission', 'interface', 'containment',
+                 'priority', 'kwargs', 'parent', '_predicates')
 
     def __init__(self, _callable, name, title = u"",
                  permission = None, interface = None, containment = None, priority=None, **kw):
         assert callable(_callable), "First argument must be a callable"
         assert isinstance(name, string_types), "Second argument name should be a string"
-        self.callable = _callable
-        self.name = name
-        self.title = title
-        self.permission = permission
-        self.interface = interface
-        self.containment = containment
-        self.priority = priority
-        self.kwargs = kw
-        self.parent = None
+        #__setattr__ is for later changes, it isn't needed before there's a parent
+        _set = object.__setattr__
+        _set(self, 'callable', _callable)
+        _set(self, 'name', name)
+        _set(self, 'title', title)
+        _set(self, 'permission', permission)
+        _set(self, 'interface', interface)
+        _set(self, 'containment', containment)
+        _set(self, 'priority', priority)
+        _set(self, 'kwargs', kw or _empty_kwargs)
+        _set(self, 'parent', None)
+        _set(self, '_predicates', None)
+
+    def __setattr__(self, name, value):
+        parent = getattr(self, 'parent', None)
+        if parent is not None:
+            if parent.frozen:
+                raise FrozenViewGroupError("The view action %r is part of the frozen view group %r "
+                                           "and can't be changed." % (self.name, parent.name))
+            #The render plan of the group depends on the attributes
+            parent._changed()
+            if name == 'interface':
+                #Move it in the interface index of the group
+                keys = [k for (k, va) in parent._data.items() if va is self]
+                for key in keys:
+                    parent._unindex(key, self)
+                object.__setattr__(self, name, value)
+                for key in keys:
+                    parent._index(key, self)
+        object.__setattr__(self, '_predicates', None)
+        object.__setattr__(self, name, value)
+
+    @property
+    def predicates(self):
+        predicates = self._predicates
+        if predicates is None:
+            predicates = []
+            if self.interface:
+                predicates.append(_interface_predicate)
+            if self.permission:
+                predicates.append(_permission_predicate)
+            if self.containment:
+                predicates.append(_containment_predicate)
+            predicates = tuple(predicates)
+            object.__setattr__(self, '_predicates', predicates)
+        return predicates
+
+    @property
+    def idempotent(self):
+        return self.kwargs.get('idempotent', True)
+
+    @property
+    def direct(self):
+        for option in _render_options:
+            if option in self.kwargs:
+                return False
+        return True
 
     def __call__(self, context, request, **kw):
-        if self.interface and not self.interface.providedBy(context):
-            return
-        if self.permission and not self.parent.perm_checker(self.permission, context, request):
-            return
-        if self.containment and not find_interface(context, self.containment):
-            return
+        predicates = self._predicates
+        if predicates is None:
+            predicates = self.predicates
+        if render_hooks:
+            return self._call_reported(predicates, context, request, kw)
+        for predicate in predicates:
+            if predicate is _permission_predicate:
+                perm_checker = self.parent._uncached_perm_checker(request)
+                if perm_checker is not None:
+                    if not perm_checker(self.permission, context, request):
+                        return
+                    continue
+            if not predicate(self, context, request, None):
+                return
+        if self.kwargs is _empty_kwargs:
+            return self.callable(context, request, self, **kw)
+        return self.render(context, request, **kw)
+
+    def _call_reported(self, predicates, context, request, kw):
+        start = clock()
+        for predicate in predicates:
+            if not predicate(self, context, request, None):
+                report(self, _predicate_status[predicate], clock() - start)
+                return
+        return self.render(context, request, **kw)
+
+    def render(self, context, request, **kw):
+        if self.kwargs is _empty_kwargs and not render_hooks:
+            return self.callable(context, request, self, **kw)
+        if self.kwargs.get('process'):
+            return _ProcessCall(self, context, request, kw).result()
+        breaker = self.kwargs.get('breaker')
+        if breaker is not None:
+            return self._render_with_breaker(breaker, context, request, kw)
+        if render_hooks:
+            start = clock()
+            try:
+                res = self._render(context, request, kw)
+            except Exception as exc:
+                report(self, 'error', clock() - start, exception = exc)
+                raise
+            report(self, 'rendered', clock() - start, res)
+            return res
+        return self._render(context, request, kw)
+
+    def _render_with_breaker(self, breaker, context, request, kw):
+        if not breaker.allow():
+            if render_hooks:
+                report(self, 'open')
+            return self.kwargs.get('fallback')
+        start = clock()
+        try:
+            res = self._render(context, request, kw)
+        except Exception as exc:
+            duration = clock() - start
+            breaker.failure()
+            logger.exception("View action %r in group %r failed, using the fallback",
+                             self.name, getattr(self.parent, 'name', None))
+            if render_hooks:
+                report(self, 'error', duration, exception = exc)
+            return self.kwargs.get('fallback')
+        duration = clock() - start
+        breaker.success(duration)
+        if render_hooks:
+            report(self, 'rendered', duration, res)
+        return res
+
+    def _render(self, context, request, kw):
+        if 'cache_key' in self.kwargs:
+            return render_cached(self, context, request, **kw)
         return self.callable(context, request, self, **kw)
 
     def __repr__(self): # pragma : no cover
@@ -170,15 +782,233 @@ class ViewAction(object):
         return "<%s '%s'>" % (classname, self.name)
 
 
+class LineageIndex(object):
+    """ Answers containment checks for a context. The lineage is walked once,
+        the first time it's needed, and the interfaces provided along it are kept
+        in a set. Works like pyramid.traversal.find_interface, so classes are
+        accepted as well.
+    """
+    __slots__ = ('context', '_nodes', '_interfaces', '_fingerprint', '_results')
+
+    def __init__(self, context):
+        self.context = context
+        self._nodes = None
+        self._interfaces = None
+        self._fingerprint = _marker
+        self._results = {}
+
+    @property
+    def nodes(self):
+        if self._nodes is None:
+            self._nodes = tuple(lineage(self.context))
+        return self._nodes
+
+    @property
+    def interfaces(self):
+        if self._interfaces is None:
+            interfaces = set()
+            for node in self.nodes:
+                interfaces.update(providedBy(node).flattened())
+            self._interfaces = interfaces
+        return self._interfaces
+
+    @property
+    def acl_fingerprint(self):
+        """ See cache.acl_fingerprint """
+        if self._fingerprint is _marker:
+            self._fingerprint = acl_fingerprint(self.context, self.nodes)
+        return self._fingerprint
+
+    def contains(self, class_or_interface):
+        try:
+            return self._results[class_or_interface]
+        except KeyError:
+            pass
+        if IInterface.providedBy(class_or_interface):
+            result = class_or_interface in self.interfaces
+        else:
+            result = False
+            for node in self.nodes:
+                if isinstance(node, class_or_interface):
+                    result = True
+                    break
+        self._results[class_or_interface] = result
+        return result
+
+
+class _Placeholder(object):
+    """ Looks like a finished future. """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+class _Budgeted(object):
+    """ Renders a view action with the budget option in the shared thread pool.
+        result() waits until the budget has passed since it was started,
+        then reports an overrun and returns the fallback.
+    """
+    __slots__ = ('va', 'future', 'started')
+
+    def __init__(self, va, context, request, kw):
+        self.va = va
+        self.started = clock()
+        self.future = pool.submit(va.render, context, request, **kw)
+
+    def result(self):
+        from concurrent.futures import TimeoutError
+        budget = self.va.kwargs['budget']
+        try:
+            return self.future.result(timeout = max(budget - (clock() - self.started), 0))
+        except TimeoutError:
+            duration = clock() - self.started
+            logger.info("View action %r in group %r didn't finish within %s seconds, "
+                        "using the fallback", self.va.name, getattr(self.va.parent, 'name', None), budget)
+            report(self.va, 'overrun', duration)
+            return self.va.kwargs.get('fallback')
+
+
+class _ProcessCall(object):
+    """ Calls a view action with the process option in the shared process pool.
+        The option project may return picklable versions of (context, request, kw),
+        otherwise context and request are None.
+    """
+    __slots__ = ('va', 'future', 'started')
+
+    def __init__(self, va, context, request, kw):
+        self.va = va
+        project = va.kwargs.get('project')
+        if project is None:
+            context = request = None
+        else:
+            context, request, kw = project(context, request, va, **kw)
+        self.started = clock()
+        self.future = pool.submit_process(va.callable, context, request, va, kw)
+
+    def result(self):
+        if not render_hooks:
+            return self.future.result()
+        try:
+            res = self.future.result()
+        except Exception as exc:
+            report(self.va, 'error', clock() - self.started, exception = exc)
+            raise
+        report(self.va, 'rendered', clock() - self.started, res)
+        return res
+
+
+def _encode(value, encoding):
+    if isinstance(value, text_type):
+        return value.encode(encoding)
+    return value
+
+
+def _buffer(value, encoding):
+    """ Encode text, pass bytes and other buffers along as they are.
+        On Python 2 buffers that str.join doesn't accept are copied.
+    """
+    if isinstance(value, text_type):
+        return value.encode(encoding)
+    if not PY3: # pragma: no cover
+        if isinstance(value, memoryview):
+            return value.tobytes()
+        if isinstance(value, bytearray):
+            return str(value)
+    return value
+
+
+def _interface_predicate(va, context, request, lineage_index):
+    return va.interface.providedBy(context)
+
+def _permission_predicate(va, context, request, lineage_index):
+    return va.parent.check_permission(va.permission, context, request, lineage_index)
+
+def _containment_predicate(va, context, request, lineage_index):
+    if lineage_index is None:
+        lineage_index = LineageIndex(context)
+    return lineage_index.contains(va.containment)
+
+_predicate_status = {_interface_predicate: 'interface',
+                     _permission_predicate: 'permission',
+                     _containment_predicate: 'containment'}
+
+
+def _render_mode(va):
+    """ Return how _iter_output renders va: 'deferred', 'process' or 'budget' for
+        those options, 'direct' if the callable can be called without going through
+        render and 'render' otherwise. It's part of the render plan, so options
+        are only read when the plan is compiled.
+    """
+    options = va.kwargs
+    if options.get('deferred'):
+        return 'deferred'
+    if options.get('process'):
+        return 'process'
+    if options.get('budget') is not None:
+        return 'budget'
+    if va.direct:
+        return 'direct'
+    return 'render'
+
+def _default_perm_checker():
+    """ Return pyramid.security.has_permission. It's imported the first time it's needed
+        since pyramid.security is slow to import.
+    """
+    global _has_permission
+    if _has_permission is None:
+        from pyramid.security import has_permission
+        _has_permission = has_permission
+    return _has_permission
+
+def get_view_group(registry, name):
+    """ Return the ViewGroup called name from registry. Raises ComponentLookupError
+        if it doesn't exist, just like registry.getUtility.
+
+        Found groups are kept in a lookup table on the registry. The table is thrown
+        away whenever a utility is registered or unregistered, which includes
+        when add_view_action creates a new group.
+    """
+    generation = getattr(getattr(registry, 'utilities', None), '_generation', None)
+    if generation is None: # pragma: no cover
+        return registry.getUtility(IViewGroup, name = name)
+    cache = getattr(registry, _view_group_cache_attr, None)
+    if cache is None or cache[0] != generation:
+        cache = (generation, {})
+        setattr(registry, _view_group_cache_attr, cache)
+    try:
+        return cache[1][name]
+    except KeyError:
+        view_group = cache[1][name] = registry.getUtility(IViewGroup, name = name)
+        return view_group
+
+def freeze_view_groups(registry):
+    """ Freeze all view groups in registry. """
+    for (name, view_group) in registry.getUtilitiesFor(IViewGroup):
+        view_group.freeze()
+
 def add_view_action(_callable, group_name, name, priority = None, registry = None, **kwargs):
     """ Create a new view action and possibly add a view group if it doesn't exist.
         Use the decorator or the directive instead of this method directly.
+        kwargs are passed to the ViewAction, see the view_action decorator for options.
     """
     if registry is None: # pragma : no cover
+        from pyramid.threadlocal import get_current_registry
         registry = get_current_registry()
     view_group = registry.queryUtility(IViewGroup, name = group_name)
     if view_group is None:
-        view_group = ViewGroup(group_name)
+        from pyramid.settings import asbool
+        from pyramid.settings import aslist
+        settings = getattr(registry, 'settings', None) or {}
+        concurrent = asbool(settings.get('betahaus.viewcomponent.concurrent', False)) or \
+            group_name in aslist(settings.get('betahaus.viewcomponent.concurrent_groups', ''))
+        visibility_cache = None
+        if settings.get('betahaus.viewcomponent.visibility_cache'):
+            visibility_cache = VisibilityCache(int(settings['betahaus.viewcomponent.visibility_cache']))
+        view_group = ViewGroup(group_name, concurrent = concurrent, visibility_cache = visibility_cache)
         registry.registerUtility(view_group, IViewGroup, name = group_name)
     va = ViewAction(_callable, name, priority = priority, **kwargs)
     view_group.add(va)
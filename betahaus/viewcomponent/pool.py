@@ -0,0 +1,135 @@
+""" Shared executors for rendering view actions concurrently,
+    one thread pool and one process pool. Both are started when they're first needed.
+    On Python 2 this requires the 'futures' backport.
+"""
+import threading
+from collections import namedtuple
+
+
+_lock = threading.Lock()
+#Marks the worker threads of the shared thread pool
+_local = threading.local()
+_thread_pool = None
+_process_pool = None
+pool_size = 10
+#None means the number of CPUs
+process_pool_size = None
+
+#Passed instead of the view action to callables in the process pool
+ProcessViewAction = namedtuple('ProcessViewAction', 'name title group')
+
+
+def configure(size):
+    """ Set the number of worker threads. A running pool will be shut down
+        and a new one will be started when it's needed.
+    """
+    global pool_size
+    pool_size = int(size)
+    shutdown(wait = False)
+
+def get_thread_pool():
+    """ Return the shared thread pool, start it if needed. """
+    global _thread_pool
+    if _thread_pool is None:
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError: # pragma: no cover
+            raise ImportError("Concurrent rendering requires concurrent.futures. "
+                              "On Python 2, install the 'futures' package.")
+        with _lock:
+            if _thread_pool is None:
+                _thread_pool = ThreadPoolExecutor(max_workers = pool_size)
+    return _thread_pool
+
+def configure_processes(size):
+    """ Set the number of worker processes. A running pool will be shut down
+        and a new one will be started when it's needed.
+    """
+    global process_pool_size, _process_pool
+    process_pool_size = size and int(size) or None
+    with _lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait = False)
+
+def get_process_pool():
+    """ Return the shared process pool, start it if needed. """
+    global _process_pool
+    if _process_pool is None:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+        except ImportError: # pragma: no cover
+            raise ImportError("Rendering in processes requires concurrent.futures. "
+                              "On Python 2, install the 'futures' package.")
+        with _lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(max_workers = process_pool_size)
+    return _process_pool
+
+def shutdown(wait = True):
+    """ Stop the shared thread and process pools if they're running. """
+    global _thread_pool, _process_pool
+    with _lock:
+        pools = (_thread_pool, _process_pool)
+        _thread_pool = _process_pool = None
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait = wait)
+
+def submit(func, *args, **kw):
+    """ Run func in the shared pool with the same pyramid threadlocals
+        as the calling thread, and return a future.
+    """
+    from pyramid.threadlocal import manager
+    return get_thread_pool().submit(_with_threadlocals, manager.get(), func, args, kw)
+
+def in_worker():
+    """ Return True if called from a task running in the shared thread pool.
+        Work started from there shouldn't wait for other tasks in the same pool,
+        since they may be queued behind the caller.
+    """
+    return getattr(_local, 'worker', False)
+
+def _with_threadlocals(threadlocals, func, args, kw):
+    from pyramid.threadlocal import manager
+    manager.push(threadlocals)
+    _local.worker = True
+    try:
+        return func(*args, **kw)
+    finally:
+        _local.worker = False
+        manager.pop()
+
+def submit_process(func, context, request, va, kw):
+    """ Call func in the shared process pool and return a future. func must be
+        importable by dotted name, and context, request and kw must be picklable.
+        va is replaced by a ProcessViewAction.
+    """
+    dotted = dotted_name(func)
+    group = va.parent
+    info = ProcessViewAction(va.name, va.title, group is not None and group.name or None)
+    return get_process_pool().submit(_call_dotted, dotted, context, request, info, kw)
+
+def dotted_name(func):
+    """ Return 'module:name' for func, or raise ValueError if it can't be imported by that name. """
+    module = getattr(func, '__module__', None)
+    name = getattr(func, '__qualname__', getattr(func, '__name__', None))
+    dotted = '%s:%s' % (module, name)
+    try:
+        found = resolve(dotted)
+    except (ImportError, AttributeError):
+        found = None
+    if found is not func:
+        raise ValueError("%r can't be rendered in a process since it isn't importable as %s" % (func, dotted))
+    return dotted
+
+def resolve(dotted):
+    """ Import and return the object called dotted, written as 'module:name'. """
+    module, name = dotted.split(':')
+    obj = __import__(module, fromlist = ['__name__'])
+    for part in name.split('.'):
+        obj = getattr(obj, part)
+    return obj
+
+def _call_dotted(dotted, context, request, va, kw):
+    return resolve(dotted)(context, request, va, **kw)
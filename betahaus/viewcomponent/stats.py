@@ -0,0 +1,120 @@
+""" Instrumentation of view action rendering.
+    Nothing is measured unless a hook is added, for instance:
+
+    >>> from betahaus.viewcomponent.stats import RenderStats, add_render_hook
+    >>> stats = RenderStats()
+    >>> add_render_hook(stats)
+"""
+import threading
+import time
+from collections import deque
+from collections import namedtuple
+
+
+clock = getattr(time, 'perf_counter', time.time)
+
+#Hooks are called with a RenderReport. Render code checks this list before
+#measuring anything, so keep the same list object.
+render_hooks = []
+
+
+class RenderReport(namedtuple('RenderReport', 'group action status duration size exception')):
+    """ Report of a single view action call.
+
+        status
+            'rendered', 'error' or the name of the predicate that stopped it:
+            'interface', 'permission' or 'containment'. 'overrun' means the view action
+            had a budget and the fallback was used. It's rendered or fails later on.
+            'open' means it has a circuit breaker that is open, so it wasn't called.
+
+        duration
+            Wall time in seconds. For stopped view actions it's the time spent
+            checking predicates.
+
+        size
+            len() of the output, if it has any length.
+
+        exception
+            The exception if status is 'error'.
+    """
+    __slots__ = ()
+
+
+def add_render_hook(hook):
+    """ Call hook with a RenderReport every time a view action is called. """
+    if hook not in render_hooks:
+        render_hooks.append(hook)
+
+def remove_render_hook(hook):
+    if hook in render_hooks:
+        render_hooks.remove(hook)
+
+def report(view_action, status, duration = 0.0, output = None, exception = None):
+    """ Create a RenderReport and pass it to all hooks. """
+    group = view_action.parent
+    try:
+        size = len(output)
+    except TypeError:
+        size = None
+    info = RenderReport(group is not None and group.name or None, view_action.name,
+                        status, duration, size, exception)
+    for hook in tuple(render_hooks):
+        hook(info)
+    return info
+
+
+class RenderStats(object):
+    """ Hook that aggregates reports per group and view action.
+        Durations of rendered calls are kept in a bounded sample to calculate percentiles.
+    """
+
+    def __init__(self, max_samples = 1000):
+        self.max_samples = max_samples
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, report):
+        key = (report.group, report.action)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {'count': 0, 'total': 0.0, 'max': 0.0, 'size': 0,
+                                              'statuses': {}, 'samples': deque(maxlen = self.max_samples)}
+            entry['count'] += 1
+            entry['total'] += report.duration
+            entry['max'] = max(entry['max'], report.duration)
+            entry['statuses'][report.status] = entry['statuses'].get(report.status, 0) + 1
+            if report.status == 'rendered':
+                entry['samples'].append(report.duration)
+                entry['size'] += report.size or 0
+
+    def percentile(self, group, action, pct):
+        """ Return the duration percentile (0-100) of rendered calls, or None if there are none. """
+        with self._lock:
+            entry = self._entries.get((group, action))
+            samples = entry is not None and sorted(entry['samples']) or []
+        return _percentile(samples, pct)
+
+    def summary(self):
+        """ Return a list of dicts, one per view action, with the slowest (in total) first. """
+        result = []
+        with self._lock:
+            for ((group, action), entry) in self._entries.items():
+                info = {'group': group, 'action': action, 'count': entry['count'], 'total': entry['total'],
+                        'max': entry['max'], 'size': entry['size'], 'statuses': dict(entry['statuses'])}
+                samples = sorted(entry['samples'])
+                for pct in (50, 90, 99):
+                    info['p%s' % pct] = _percentile(samples, pct)
+                result.append(info)
+        result.sort(key = lambda x: x['total'], reverse = True)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return None
+    return samples[int(round(pct / 100.0 * (len(samples) - 1)))]
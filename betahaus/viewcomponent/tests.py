@@ -1,4 +1,5 @@
 from unittest import TestCase
+from unittest import skipIf
 
 from pyramid import testing
 from zope.interface.verify import verifyClass
@@ -6,6 +7,8 @@ from zope.interface.verify import verifyObject
 
 from betahaus.viewcomponent.interfaces import IViewAction
 from betahaus.viewcomponent.interfaces import IViewGroup
+from betahaus.viewcomponent.compat import HAS_ASYNC
+from betahaus.viewcomponent.compat import PY3
 from betahaus.viewcomponent.fixtures import contexts
 
 
@@ -18,6 +21,9 @@ def _callable_text(context, request, va):
 def _name_callable(context, request, va):
     return va.name
 
+def _name_kw_callable(context, request, va, **kw):
+    return va.name
+
 def _bad_callable(*args):
     return TestCase
 
@@ -215,6 +221,77 @@ class ViewGroupTests(TestCase):
         self.assertEqual(obj.items(), [('three', va3), ('two', va2), ('one', va1)])
         self.assertEqual(obj.order, ['three', 'two', 'one'])
 
+    def test_priority_same_as_incremental(self):
+        import random
+        for seed in range(50):
+            rand = random.Random(seed)
+            obj = self._cut()
+            expected = []
+            for i in range(30):
+                priority = rand.choice([None, rand.randint(0, 5)])
+                name = 'va%s' % i
+                #How priorities were placed before insertion was deferred
+                index = len(expected)
+                if priority is None:
+                    expected.append(name)
+                else:
+                    for other in reversed(expected):
+                        if obj[other].priority is not None and obj[other].priority <= priority:
+                            break
+                        index -= 1
+                    expected.insert(index, name)
+                obj.add(self._view_action(_name_callable, name, priority = priority))
+                if rand.random() < 0.1:
+                    self.assertEqual(obj.order, expected)
+            self.assertEqual(obj.order, expected)
+
+    def test_priority_after_order_set(self):
+        obj = self._cut()
+        obj.add(self._view_action(_name_callable, 'one', priority = 1))
+        obj.add(self._view_action(_name_callable, 'two', priority = 2))
+        obj.order = ['two', 'one']
+        obj.add(self._view_action(_name_callable, 'three', priority = 1))
+        obj.add(self._view_action(_name_callable, 'four', priority = 3))
+        self.assertEqual(obj.order, ['two', 'one', 'three', 'four'])
+
+    def test_update(self):
+        obj = self._cut()
+        va1 = self._view_action(_name_callable, 'one', priority = 2)
+        va2 = self._view_action(_name_callable, 'two', priority = 1)
+        obj.update([va1, va2])
+        self.assertEqual(obj.order, ['two', 'one'])
+        obj.update({'three': self._view_action(_name_callable, 'three', priority = 0)})
+        self.assertEqual(obj.order, ['three', 'two', 'one'])
+
+    def test_delete_pending(self):
+        obj = self._cut()
+        obj.add(self._view_action(_name_callable, 'one', priority = 2))
+        obj.add(self._view_action(_name_callable, 'two', priority = 1))
+        del obj['one']
+        self.assertEqual(obj.order, ['two'])
+        self.assertEqual(obj(None, None), 'two')
+
+    def test_first_renders_in_threads(self):
+        import threading
+        import time
+        from betahaus.viewcomponent.models import ViewGroup
+        class _SlowViewGroup(ViewGroup):
+            __slots__ = ()
+            def _place(self, order, pending):
+                time.sleep(0.05)
+                return super(_SlowViewGroup, self)._place(order, pending)
+        obj = _SlowViewGroup()
+        obj.add(self._view_action(_name_callable, 'one', priority = 2))
+        obj.add(self._view_action(_name_callable, 'two', priority = 1))
+        results = []
+        threads = [threading.Thread(target = lambda: results.append(obj(None, None))) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['twoone'] * 3)
+        self.assertEqual(obj(None, None), 'twoone')
+
     def test_same_key_overrides_other(self):
         obj = self._cut()
         va1 = self._view_action(_name_callable, 'one')
@@ -298,6 +375,72 @@ class ViewGroupTests(TestCase):
         obj.add(va1)
         self.assertRaises(ValueError, obj, None, None, as_type = '404')
 
+    def test_render_plan(self):
+        obj = self._cut()
+        va1 = self._view_action(_name_callable, 'one')
+        va2 = self._view_action(_name_callable, 'two', interface = contexts.IRoot)
+        obj.add(va1)
+        obj.add(va2)
+        self.assertEqual(obj.render_plan, (('one', va1, ()), ('two', va2, va2.predicates)))
+
+    def test_render_plan_reused(self):
+        obj = self._cut()
+        obj.add(self._view_action(_name_callable, 'one'))
+        self.failUnless(obj.render_plan is obj.render_plan)
+
+    def test_render_plan_rebuilt_on_change(self):
+        obj = self._cut()
+        obj.add(self._view_action(_name_callable, 'one'))
+        obj.add(self._view_action(_name_callable, 'two'))
+        self.assertEqual(obj(None, None), 'onetwo')
+        obj.order = ['two', 'one']
+        self.assertEqual(obj(None, None), 'twoone')
+        obj.add(self._view_action(_name_callable, 'three', priority = 1))
+        self.assertEqual(obj(None, None), 'threetwoone')
+        del obj['two']
+        self.assertEqual(obj(None, None), 'threeone')
+
+    def test_interface_index(self):
+        obj = self._cut()
+        obj.add(self._view_action(_name_callable, 'one', interface = contexts.IRoot))
+        obj.add(self._view_action(_name_callable, 'two', interface = contexts.IRoot))
+        obj.add(self._view_action(_name_callable, 'three'))
+        self.assertEqual(obj._interface_index, {contexts.IRoot: set(['one', 'two']), None: set(['three'])})
+        del obj['one']
+        obj.add(self._view_action(_name_callable, 'two', interface = contexts.IOrganisation))
+        self.assertEqual(obj._interface_index, {contexts.IOrganisation: set(['two']), None: set(['three'])})
+
+    def test_non_matching_interface_not_checked(self):
+        checked = []
+        def _checker(permission, context, request):
+            checked.append(permission)
+            return True
+        obj = self._cut(perm_checker = _checker)
+        obj.add(self._view_action(_name_callable, 'one', interface = contexts.IRoot, permission = 'root'))
+        obj.add(self._view_action(_name_callable, 'two', interface = contexts.IOrganisation, permission = 'org'))
+        obj.add(self._view_action(_name_callable, 'three', permission = 'any'))
+        self.assertEqual(obj(contexts.Organisation(), None), 'twothree')
+        self.assertEqual(checked, ['org', 'any'])
+
+    def test_interface_dispatch_keeps_order(self):
+        obj = self._cut()
+        obj.add(self._view_action(_name_callable, 'one', interface = contexts.IOrganisation))
+        obj.add(self._view_action(_name_callable, 'two'))
+        obj.add(self._view_action(_name_callable, 'three', interface = contexts.IOrganisation))
+        obj.add(self._view_action(_name_callable, 'four', interface = contexts.IRoot))
+        obj.order = ['three', 'four', 'two', 'one']
+        self.assertEqual(obj(contexts.Organisation(), None, spacer = ','), 'three,two,one')
+        self.assertEqual(obj(contexts.Organisation(), None, as_type = 'list', empty_val = '-'),
+                         ['three', '-', 'two', 'one'])
+
+    def test_render_respects_predicates(self):
+        obj = self._cut()
+        obj.add(self._view_action(_name_callable, 'one', interface = contexts.IRoot))
+        obj.add(self._view_action(_name_callable, 'two', interface = contexts.IOrganisation))
+        self.assertEqual(obj(contexts.Root(), None), 'one')
+        self.assertEqual(obj(contexts.Root(), None, as_type = 'dict', empty_val = ''),
+                         {'one': 'one', 'two': ''})
+
 
 class ViewActionTests(TestCase):
     def setUp(self):
@@ -377,6 +520,30 @@ class ViewActionTests(TestCase):
         request = testing.DummyRequest()
         self.assertEqual(obj(context, request), None)
 
+    def test_changed_interface_noticed(self):
+        vg = self._dummy_vg()
+        obj = self._cut(_name_callable, 'x')
+        vg.add(obj)
+        self.assertEqual(vg.as_list(contexts.Organisation(), None), ['x'])
+        obj.interface = contexts.IRoot
+        self.assertEqual(vg.as_list(contexts.Organisation(), None), [])
+        self.assertEqual(vg.as_list(contexts.Root(), None), ['x'])
+        obj.interface = None
+        self.assertEqual(vg.as_list(contexts.Organisation(), None), ['x'])
+        del vg['x']
+        self.assertEqual(vg._interface_index, {})
+
+    def test_changed_attributes_noticed(self):
+        vg = self._dummy_vg(lambda *args: False)
+        obj = self._cut(_name_callable, 'name')
+        vg.add(obj)
+        self.assertEqual(obj.predicates, ())
+        self.assertEqual(vg(None, None), 'name')
+        obj.permission = 'Dummy'
+        self.assertEqual(len(obj.predicates), 1)
+        self.assertEqual(obj(None, None), None)
+        self.assertEqual(vg(None, None), '')
+
 
 class ViewActionDecoratorTests(TestCase):
 
@@ -458,3 +625,1787 @@ class RenderViewActionTests(TestCase):
         res = self._fut(context, request, 'group', 'one')
         expected = "one"
         self.assertEqual(res, expected)
+
+
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    @property
+    def _cut(self):
+        from betahaus.viewcomponent.cache import PermissionCache
+        return PermissionCache
+
+    def _counting_checker(self, result = True):
+        calls = []
+        def _checker(permission, context, request):
+            calls.append((permission, context))
+            return result
+        return _checker, calls
+
+    def test_check_caches_result(self):
+        checker, calls = self._counting_checker()
+        obj = self._cut()
+        context = testing.DummyResource()
+        self.failUnless(obj.check(checker, 'View', context, None))
+        self.failUnless(obj.check(checker, 'View', context, None))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(obj.hits, 1)
+        self.assertEqual(obj.misses, 1)
+
+    def test_check_keyed_by_permission_and_context(self):
+        checker, calls = self._counting_checker()
+        obj = self._cut()
+        context = testing.DummyResource()
+        obj.check(checker, 'View', context, None)
+        obj.check(checker, 'Edit', context, None)
+        obj.check(checker, 'View', testing.DummyResource(), None)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(obj.hits, 0)
+
+    def test_group_uses_request_cache(self):
+        from betahaus.viewcomponent.cache import enable_permission_cache
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        checker, calls = self._counting_checker()
+        obj = ViewGroup('group', perm_checker = checker)
+        obj.add(ViewAction(_name_callable, 'one', permission = 'View'))
+        obj.add(ViewAction(_name_callable, 'two', permission = 'View'))
+        obj.add(ViewAction(_name_callable, 'three', permission = 'Edit'))
+        request = testing.DummyRequest()
+        cache = enable_permission_cache(request)
+        context = testing.DummyResource()
+        self.assertEqual(obj(context, request), 'onetwothree')
+        self.assertEqual(obj(context, request), 'onetwothree')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(cache.misses, 2)
+
+    def test_group_without_cache(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        checker, calls = self._counting_checker()
+        obj = ViewGroup('group', perm_checker = checker)
+        obj.add(ViewAction(_name_callable, 'one', permission = 'View'))
+        obj.add(ViewAction(_name_callable, 'two', permission = 'View'))
+        obj(testing.DummyResource(), testing.DummyRequest())
+        self.assertEqual(len(calls), 2)
+
+    def test_enable_returns_same_cache(self):
+        from betahaus.viewcomponent.cache import enable_permission_cache
+        request = testing.DummyRequest()
+        self.assertIs(enable_permission_cache(request), enable_permission_cache(request))
+
+    def test_setting_enables_cache_on_new_request(self):
+        from pyramid.events import NewRequest
+        from betahaus.viewcomponent.cache import get_permission_cache
+        self.config.registry.settings['betahaus.viewcomponent.permission_cache'] = 'true'
+        self.config.include('betahaus.viewcomponent')
+        request = testing.DummyRequest()
+        self.config.registry.notify(NewRequest(request))
+        self.failUnless(get_permission_cache(request) is not None)
+
+
+class LineageIndexTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    @property
+    def _cut(self):
+        from betahaus.viewcomponent.models import LineageIndex
+        return LineageIndex
+
+    def _tree(self):
+        root = contexts.Root()
+        root['org'] = org = contexts.Organisation()
+        org['d'] = context = testing.DummyResource()
+        return context
+
+    def test_contains_interface(self):
+        obj = self._cut(self._tree())
+        self.failUnless(obj.contains(contexts.IRoot))
+        self.failUnless(obj.contains(contexts.IOrganisation))
+
+    def test_contains_interface_not_in_lineage(self):
+        root = contexts.Root()
+        root['d'] = context = testing.DummyResource()
+        obj = self._cut(context)
+        self.failIf(obj.contains(contexts.IOrganisation))
+
+    def test_contains_class(self):
+        obj = self._cut(self._tree())
+        self.failUnless(obj.contains(contexts.Organisation))
+        self.failIf(obj.contains(TestCase))
+
+    def test_lineage_walked_once(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        walked = []
+        class _Counting(object):
+            def __init__(self, parent):
+                self._parent = parent
+            @property
+            def __parent__(self):
+                walked.append(self)
+                return self._parent
+        context = _Counting(contexts.Root())
+        obj = ViewGroup('group')
+        obj.add(ViewAction(_name_callable, 'one', containment = contexts.IRoot))
+        obj.add(ViewAction(_name_callable, 'two', containment = contexts.IRoot))
+        obj.add(ViewAction(_name_callable, 'three', containment = contexts.IOrganisation))
+        self.assertEqual(obj(context, None), 'onetwo')
+        self.assertEqual(len(walked), 1)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    @property
+    def _cut(self):
+        from betahaus.viewcomponent.cache import FragmentCache
+        return FragmentCache
+
+    def _counting_action(self, name = 'action', **kw):
+        from betahaus.viewcomponent.models import add_view_action
+        calls = []
+        def _callable(context, request, va, **kw):
+            calls.append(context)
+            return "%s-%s" % (va.name, len(calls))
+        va = add_view_action(_callable, 'group', name, registry = self.config.registry, **kw)
+        return va, calls
+
+    def test_verify_class(self):
+        from betahaus.viewcomponent.interfaces import IFragmentCache
+        self.failUnless(verifyClass(IFragmentCache, self._cut))
+
+    def test_get_set(self):
+        obj = self._cut()
+        obj.set('default', 'k', 'v')
+        self.assertEqual(obj.get('default', 'k'), 'v')
+        self.assertEqual(obj.get('default', '404'), None)
+        self.assertEqual(obj.stats('default'), {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1})
+
+    def test_ttl(self):
+        now = [100]
+        obj = self._cut(clock = lambda: now[0])
+        obj.set('default', 'k', 'v', ttl = 10)
+        self.assertEqual(obj.get('default', 'k'), 'v')
+        now[0] = 111
+        self.assertEqual(obj.get('default', 'k'), None)
+
+    def test_lru_eviction_per_region(self):
+        obj = self._cut(default_size = 2, region_sizes = {'small': 1})
+        obj.set('default', 'a', 1)
+        obj.set('default', 'b', 2)
+        obj.get('default', 'a')
+        obj.set('default', 'c', 3)
+        self.assertEqual(obj.get('default', 'a'), 1)
+        self.assertEqual(obj.get('default', 'b'), None)
+        obj.set('small', 'a', 1)
+        obj.set('small', 'b', 2)
+        self.assertEqual(obj.stats('small')['evictions'], 1)
+        self.assertEqual(obj.stats('default')['evictions'], 1)
+
+    def test_view_action_output_cached(self):
+        va, calls = self._counting_action(cache_key = lambda *args, **kw: 'all')
+        request = testing.DummyRequest()
+        self.assertEqual(va(None, request), 'action-1')
+        self.assertEqual(va(None, request), 'action-1')
+        self.assertEqual(len(calls), 1)
+
+    def test_view_action_key_none_not_cached(self):
+        va, calls = self._counting_action(cache_key = lambda *args, **kw: None)
+        request = testing.DummyRequest()
+        va(None, request)
+        va(None, request)
+        self.assertEqual(len(calls), 2)
+
+    def test_view_action_predicates_checked_before_cache(self):
+        va, calls = self._counting_action(cache_key = lambda *args, **kw: 'all',
+                                          interface = contexts.IRoot)
+        request = testing.DummyRequest()
+        self.assertEqual(va(contexts.Root(), request), 'action-1')
+        self.assertEqual(va(contexts.Organisation(), request), None)
+
+    def test_invalidate_action(self):
+        from betahaus.viewcomponent.cache import get_fragment_cache
+        va, calls = self._counting_action(cache_key = lambda context, *args, **kw: context)
+        other, other_calls = self._counting_action('other', cache_key = lambda *args, **kw: 'all')
+        request = testing.DummyRequest()
+        va('a', request)
+        va('b', request)
+        other(None, request)
+        cache = get_fragment_cache(self.config.registry)
+        cache.invalidate(va, 'a')
+        va('a', request)
+        va('b', request)
+        self.assertEqual(calls, ['a', 'b', 'a'])
+        cache.invalidate(va, key = None)
+        va('b', request)
+        other(None, request)
+        self.assertEqual(calls, ['a', 'b', 'a', 'b'])
+        self.assertEqual(len(other_calls), 1)
+
+    def test_region_sizes_from_settings(self):
+        from betahaus.viewcomponent.cache import get_fragment_cache
+        self.config.registry.settings['betahaus.viewcomponent.fragment_cache.size'] = '5'
+        self.config.registry.settings['betahaus.viewcomponent.fragment_cache.regions'] = 'footer:1 news:20'
+        self.config.include('betahaus.viewcomponent')
+        cache = get_fragment_cache(self.config.registry)
+        self.assertEqual(cache.default_size, 5)
+        self.assertEqual(cache.region_sizes, {'footer': 1, 'news': 20})
+
+
+class ConcurrentRenderTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _group(self, **kw):
+        import threading
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        event = threading.Event()
+        def _waiting(context, request, va, **kw):
+            if event.wait(2) or event.is_set():
+                return 'waited'
+            return 'timeout'
+        def _setting(context, request, va, **kw):
+            event.set()
+            return 'set'
+        obj = ViewGroup('group', **kw)
+        obj.add(ViewAction(_waiting, 'waiting'))
+        obj.add(ViewAction(_none_callable, 'empty'))
+        obj.add(ViewAction(_setting, 'setting'))
+        return obj
+
+    def test_concurrent_call(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, spacer = ',', concurrent = True), 'waited,set')
+
+    def test_concurrent_attribute(self):
+        obj = self._group(concurrent = True)
+        self.assertEqual(obj(None, None, as_type = 'list', empty_val = '-'), ['waited', '-', 'set'])
+
+    def test_concurrent_dict(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'dict', concurrent = True),
+                         {'waiting': 'waited', 'setting': 'set'})
+
+    def test_concurrent_keeps_threadlocals(self):
+        from pyramid.threadlocal import get_current_request
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        def _current(context, request, va, **kw):
+            return get_current_request() is request and 'same' or 'other'
+        obj = ViewGroup('group', concurrent = True)
+        obj.add(ViewAction(_current, 'current'))
+        request = testing.DummyRequest()
+        self.config.begin(request = request)
+        self.assertEqual(obj(None, request), 'same')
+
+    def test_concurrent_exception_raised(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        obj = ViewGroup('group', concurrent = True)
+        obj.add(ViewAction(_failing_callable, 'fail'))
+        self.assertRaises(Exception, obj, None, None)
+
+    def test_nested_concurrent_groups(self):
+        import threading
+        from betahaus.viewcomponent import pool
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        inner = ViewGroup('inner', concurrent = True)
+        inner.add(ViewAction(_name_callable, 'a'))
+        inner.add(ViewAction(_name_callable, 'b'))
+        def _render_inner(context, request, va, **kw):
+            return inner(context, request)
+        outer = ViewGroup('outer', concurrent = True)
+        outer.add(ViewAction(_render_inner, 'one'))
+        outer.add(ViewAction(_render_inner, 'two'))
+        result = []
+        size = pool.pool_size
+        pool.configure(2)
+        try:
+            thread = threading.Thread(target = lambda: result.append(outer(None, None, spacer = ',')))
+            thread.daemon = True
+            thread.start()
+            thread.join(5)
+        finally:
+            pool.configure(size)
+        self.assertEqual(result, ['ab,ab'])
+
+    def test_in_worker(self):
+        from betahaus.viewcomponent import pool
+        self.failIf(pool.in_worker())
+        self.failUnless(pool.submit(pool.in_worker).result())
+        self.failIf(pool.in_worker())
+
+    def test_settings_enable_for_group(self):
+        from betahaus.viewcomponent.models import add_view_action
+        self.config.registry.settings['betahaus.viewcomponent.concurrent_groups'] = 'sidebar'
+        add_view_action(_name_callable, 'sidebar', 'one', registry = self.config.registry)
+        add_view_action(_name_callable, 'other', 'one', registry = self.config.registry)
+        self.failUnless(self.config.registry.getUtility(IViewGroup, name = 'sidebar').concurrent)
+        self.failIf(self.config.registry.getUtility(IViewGroup, name = 'other').concurrent)
+
+
+@skipIf(not HAS_ASYNC, "asyncio support requires Python 3.6")
+class AsyncRenderTests(TestCase):
+    def setUp(self):
+        import asyncio
+        self.config = testing.setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        import asyncio
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        testing.tearDown()
+
+    def _group(self):
+        from betahaus.viewcomponent.fixtures import aio
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        obj = ViewGroup('group')
+        obj.add(ViewAction(aio.waiting_action, 'waiting'))
+        obj.add(ViewAction(aio.empty_action, 'empty'))
+        obj.add(ViewAction(_name_kw_callable, 'sync'))
+        obj.add(ViewAction(aio.setting_action, 'setting'))
+        obj.add(ViewAction(aio.sleeping_action, 'denied', interface = contexts.IOrganisation))
+        return obj
+
+    def _event(self):
+        import asyncio
+        return asyncio.Event()
+
+    def test_verify_obj(self):
+        from betahaus.viewcomponent.interfaces import IAsyncViewGroup
+        self.failUnless(verifyObject(IAsyncViewGroup, self._group()))
+
+    def test_as_list_async(self):
+        obj = self._group()
+        res = self.loop.run_until_complete(obj.as_list_async(None, None, event = self._event()))
+        self.assertEqual(res, ['waiting', 'sync', 'setting'])
+
+    def test_as_list_async_deferred(self):
+        from betahaus.viewcomponent.fixtures import aio
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj.add(ViewAction(aio.sleeping_action, 'deferred', deferred = True))
+        request = testing.DummyRequest()
+        res = self.loop.run_until_complete(obj.as_list_async(None, request, event = self._event()))
+        self.assertEqual(res, ['waiting', 'sync', 'setting', '<div data-deferred="deferred-0"></div>'])
+
+    def test_as_list_async_breaker(self):
+        from betahaus.viewcomponent.breaker import CircuitBreaker
+        from betahaus.viewcomponent.fixtures import aio
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        breaker = CircuitBreaker(failures = 1)
+        obj = ViewGroup('group')
+        obj.add(ViewAction(aio.failing_action, 'fails', breaker = breaker, fallback = 'fb'))
+        res = self.loop.run_until_complete(obj.as_list_async(None, None))
+        self.assertEqual(res, ['fb'])
+        self.assertEqual(breaker.info()['state'], 'open')
+        self.assertEqual(breaker.info()['trips'], 1)
+        res = self.loop.run_until_complete(obj.as_list_async(None, None))
+        self.assertEqual(res, ['fb'])
+
+    def test_as_list_async_empty_val(self):
+        obj = self._group()
+        res = self.loop.run_until_complete(obj.as_list_async(None, None, empty_val = '-', event = self._event()))
+        self.assertEqual(res, ['waiting', '-', 'sync', 'setting', '-'])
+
+    def test_as_dict_async(self):
+        obj = self._group()
+        res = self.loop.run_until_complete(obj.as_dict_async(None, None, event = self._event()))
+        self.assertEqual(res, {'waiting': 'waiting', 'sync': 'sync', 'setting': 'setting'})
+
+    def test_render_view_group_async(self):
+        from betahaus.viewcomponent import render_view_group_async
+        from betahaus.viewcomponent.fixtures import aio
+        from betahaus.viewcomponent.models import add_view_action
+        add_view_action(aio.sleeping_action, 'group', 'one', registry = self.config.registry, delay = 0.01)
+        add_view_action(aio.sleeping_action, 'group', 'two', registry = self.config.registry)
+        request = testing.DummyRequest()
+        res = self.loop.run_until_complete(render_view_group_async(None, request, 'group', spacer = ','))
+        self.assertEqual(res, 'one,two')
+
+    def test_fragment_cache_async(self):
+        from betahaus.viewcomponent.fixtures import aio
+        from betahaus.viewcomponent.cache import get_fragment_cache
+        from betahaus.viewcomponent.models import add_view_action
+        va = add_view_action(aio.sleeping_action, 'group', 'one', registry = self.config.registry,
+                             cache_key = lambda *args, **kw: 'all')
+        request = testing.DummyRequest()
+        vg = self.config.registry.getUtility(IViewGroup, name = 'group')
+        self.assertEqual(self.loop.run_until_complete(vg.as_list_async(None, request)), ['one'])
+        self.assertEqual(self.loop.run_until_complete(vg.as_list_async(None, request)), ['one'])
+        self.assertEqual(get_fragment_cache(self.config.registry).stats('default')['hits'], 1)
+
+
+class StreamRenderTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        obj = ViewGroup('group')
+        obj.add(ViewAction(lambda context, request, va: u'\xe5', 'text'))
+        obj.add(ViewAction(_none_callable, 'empty'))
+        obj.add(ViewAction(lambda context, request, va: b'bytes', 'bytes'))
+        return obj
+
+    def test_as_stream(self):
+        obj = self._group()
+        self.assertEqual(list(obj.as_stream(None, None, spacer = u'-')), [b'\xc3\xa5', b'-', b'bytes'])
+
+    def test_as_stream_is_lazy(self):
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj.add(ViewAction(_failing_callable, 'fail'))
+        stream = obj.as_stream(None, None)
+        self.assertEqual(next(stream), b'\xc3\xa5')
+        self.assertEqual(next(stream), b'bytes')
+        self.assertRaises(Exception, next, stream)
+
+    def test_as_type_stream(self):
+        obj = self._group()
+        res = obj(None, None, as_type = 'stream', spacer = ',', empty_val = '', encoding = 'latin-1')
+        self.assertEqual(b''.join(res), b'\xe5,,bytes')
+
+    def test_write_to(self):
+        from io import BytesIO
+        obj = self._group()
+        fileobj = BytesIO()
+        self.assertEqual(obj.write_to(fileobj, None, None, spacer = ' '), 8)
+        self.assertEqual(fileobj.getvalue(), b'\xc3\xa5 bytes')
+
+    def test_app_iter(self):
+        from pyramid.response import Response
+        obj = self._group()
+        response = Response()
+        response.app_iter = obj.as_stream(None, None)
+        self.assertEqual(response.body, b'\xc3\xa5bytes')
+
+
+class RenderStatsTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.reports = []
+
+    def tearDown(self):
+        from betahaus.viewcomponent.stats import render_hooks
+        del render_hooks[:]
+        testing.tearDown()
+
+    def _hook(self):
+        from betahaus.viewcomponent.stats import add_render_hook
+        add_render_hook(self.reports.append)
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        obj = ViewGroup('group', perm_checker = lambda *args: False)
+        obj.add(ViewAction(_name_callable, 'one'))
+        obj.add(ViewAction(_name_callable, 'denied', permission = 'View'))
+        obj.add(ViewAction(_name_callable, 'org', interface = contexts.IOrganisation))
+        obj.add(ViewAction(_name_callable, 'contained', containment = contexts.IOrganisation))
+        return obj
+
+    def test_no_reports_without_hook(self):
+        from betahaus.viewcomponent.stats import render_hooks
+        self.assertEqual(render_hooks, [])
+        self._group()(None, None)
+        self.assertEqual(self.reports, [])
+
+    def test_reports(self):
+        self._hook()
+        obj = self._group()
+        obj(None, None, empty_val = '')
+        self.assertEqual([(x.group, x.action, x.status, x.size) for x in self.reports],
+                         [('group', 'one', 'rendered', 3),
+                          ('group', 'denied', 'permission', None),
+                          ('group', 'org', 'interface', None),
+                          ('group', 'contained', 'containment', None)])
+
+    def test_reports_without_empty_val(self):
+        self._hook()
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'list'), ['one'])
+        self.assertEqual([(x.action, x.status) for x in self.reports],
+                         [('one', 'rendered'), ('denied', 'permission'),
+                          ('org', 'interface'), ('contained', 'containment')])
+
+    def test_report_from_view_action_call(self):
+        self._hook()
+        obj = self._group()
+        obj['org'](None, None)
+        self.assertEqual(self.reports[0].status, 'interface')
+
+    def test_report_error(self):
+        from betahaus.viewcomponent.models import ViewAction
+        self._hook()
+        obj = self._group()
+        obj.add(ViewAction(_failing_callable, 'fail'))
+        self.assertRaises(Exception, obj, None, None)
+        self.assertEqual(self.reports[-1].status, 'error')
+        self.assertEqual(str(self.reports[-1].exception), 'Buhu!')
+
+    def test_render_stats(self):
+        from betahaus.viewcomponent.stats import RenderReport
+        from betahaus.viewcomponent.stats import RenderStats
+        stats = RenderStats()
+        for i in range(1, 101):
+            stats(RenderReport('group', 'one', 'rendered', i / 100.0, 2, None))
+        stats(RenderReport('group', 'one', 'permission', 0.0, None, None))
+        stats(RenderReport('group', 'two', 'rendered', 0.5, 1, None))
+        self.assertEqual(stats.percentile('group', 'one', 50), 0.51)
+        self.assertEqual(stats.percentile('group', 'one', 99), 0.99)
+        self.assertEqual(stats.percentile('group', '404', 99), None)
+        summary = stats.summary()
+        self.assertEqual([x['action'] for x in summary], ['one', 'two'])
+        self.assertEqual(summary[0]['count'], 101)
+        self.assertEqual(summary[0]['statuses'], {'rendered': 100, 'permission': 1})
+        self.assertEqual(summary[0]['size'], 200)
+
+    def test_render_stats_as_hook(self):
+        from betahaus.viewcomponent.stats import add_render_hook
+        from betahaus.viewcomponent.stats import RenderStats
+        stats = RenderStats()
+        add_render_hook(stats)
+        obj = self._group()
+        obj(None, None)
+        obj(None, None)
+        counts = dict([(x['action'], x['count']) for x in stats.summary()])
+        self.assertEqual(counts, {'one': 2, 'denied': 2, 'org': 2, 'contained': 2})
+
+
+class BenchmarkTests(TestCase):
+
+    def test_run_benchmarks(self):
+        from betahaus.viewcomponent.benchmarks import BENCHMARKS
+        from betahaus.viewcomponent.benchmarks import run_benchmarks
+        res = run_benchmarks(size = 5, repeat = 1, number = 1)
+        self.assertEqual(set(res['results']), set([x.__name__ for x in BENCHMARKS]))
+        self.assertEqual(set(res['startup']), set(['import', 'import_plugins', 'scan', 'pyramid_loaded']))
+        self.assertEqual(res['meta']['size'], 5)
+
+    def test_compare(self):
+        from betahaus.viewcomponent.benchmarks import compare
+        old = {'results': {'a': {'best': 2.0}, 'b': {'best': 1.0}}}
+        new = {'results': {'a': {'best': 1.0}, 'c': {'best': 1.0}}}
+        self.assertEqual(compare(old, new), [('a', 2.0, 1.0, 0.5)])
+
+    def test_memory_usage(self):
+        from betahaus.viewcomponent.benchmarks import memory_usage
+        res = memory_usage(size = 100)
+        self.failUnless(0 < res['view_action'] < res['view_action_unslotted'])
+
+    def test_startup_usage(self):
+        from betahaus.viewcomponent.benchmarks import startup_usage
+        res = startup_usage(size = 20)
+        self.failIf(res['pyramid_loaded'])
+        self.failUnless(res['scan'] > 0)
+
+
+class RenderManyTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.checked = []
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _checker(self, permission, context, request):
+        self.checked.append((permission, context))
+        return getattr(context, 'allowed', True)
+
+    def _group(self):
+        from betahaus.viewcomponent.models import add_view_action
+        add_view_action(_name_callable, 'group', 'one', registry = self.config.registry, permission = 'View')
+        add_view_action(_name_callable, 'group', 'two', registry = self.config.registry, permission = 'View')
+        add_view_action(_name_callable, 'group', 'org', registry = self.config.registry,
+                        interface = contexts.IOrganisation)
+        vg = self.config.registry.getUtility(IViewGroup, name = 'group')
+        vg.perm_checker = self._checker
+        return vg
+
+    def _contexts(self):
+        root = contexts.Root()
+        root.__acl__ = [('Allow', 'role:Admin', ['View', 'Edit'])]
+        root['a'] = a = testing.DummyResource()
+        root['b'] = b = testing.DummyResource()
+        root['org'] = org = contexts.Organisation()
+        return [a, b, org]
+
+    @property
+    def _fut(self):
+        from betahaus.viewcomponent import render_view_group_many
+        return render_view_group_many
+
+    def test_render_view_group_many(self):
+        self._group()
+        request = testing.DummyRequest()
+        res = self._fut(self._contexts(), request, 'group', spacer = ',')
+        self.assertEqual(res, ['one,two', 'one,two', 'one,two,org'])
+
+    def test_permissions_shared_for_same_acl(self):
+        self._group()
+        request = testing.DummyRequest()
+        self._fut(self._contexts(), request, 'group', share_permissions = True)
+        self.assertEqual(len(self.checked), 1)
+
+    def test_different_acl_checked(self):
+        self._group()
+        context_list = self._contexts()
+        context_list[1].__acl__ = [('Deny', 'system.Everyone', 'View')]
+        context_list[1].allowed = False
+        request = testing.DummyRequest()
+        res = self._fut(context_list, request, 'group', as_type = 'list', share_permissions = True)
+        self.assertEqual(res, [['one', 'two'], [], ['one', 'two', 'org']])
+        self.assertEqual(len(self.checked), 2)
+
+    def test_not_shared_by_default(self):
+        self._group()
+        request = testing.DummyRequest()
+        self._fut(self._contexts(), request, 'group')
+        self.assertEqual(len(self.checked), 6)
+
+    def test_shared_lazy_types(self):
+        self._group()
+        request = testing.DummyRequest()
+        for as_type in ('generator', 'stream'):
+            self.assertRaises(ValueError, self._fut, self._contexts(), request, 'group',
+                              as_type = as_type, share_permissions = True)
+        res = self._fut(self._contexts(), request, 'group', as_type = 'generator')
+        self.assertEqual([list(x) for x in res][0], ['one', 'two'])
+
+    def test_owner_based_checker_not_shared(self):
+        vg = self._group()
+        vg.perm_checker = lambda permission, context, request: getattr(context, 'owner', False)
+        context_list = self._contexts()
+        context_list[1].owner = True
+        request = testing.DummyRequest()
+        res = self._fut(context_list[:2], request, 'group', as_type = 'list')
+        self.assertEqual(res, [[], ['one', 'two']])
+        res = self._fut(context_list[1::-1], request, 'group', as_type = 'list')
+        self.assertEqual(res, [['one', 'two'], []])
+
+    def test_lineage_fingerprint_used(self):
+        from betahaus.viewcomponent import cache
+        self._group()
+        calls = []
+        original = cache.acl_fingerprint
+        def _counting(context, nodes = None):
+            calls.append(nodes)
+            return original(context, nodes)
+        cache.acl_fingerprint = _counting
+        try:
+            self._fut(self._contexts(), testing.DummyRequest(), 'group', share_permissions = True)
+        finally:
+            cache.acl_fingerprint = original
+        self.failIf([x for x in calls if x is None])
+
+    def test_request_cache_restored(self):
+        from betahaus.viewcomponent.cache import enable_permission_cache
+        from betahaus.viewcomponent.cache import get_permission_cache
+        vg = self._group()
+        request = testing.DummyRequest()
+        cache = enable_permission_cache(request)
+        vg.render_many(self._contexts(), request)
+        self.failUnless(get_permission_cache(request) is cache)
+
+    def test_acl_fingerprint(self):
+        from pyramid.security import ALL_PERMISSIONS
+        from betahaus.viewcomponent.cache import acl_fingerprint
+        root = contexts.Root()
+        root.__acl__ = [('Allow', 'role:Admin', ALL_PERMISSIONS)]
+        root['a'] = a = testing.DummyResource()
+        root['b'] = b = testing.DummyResource()
+        self.assertEqual(acl_fingerprint(a), acl_fingerprint(b))
+        b.__acl__ = lambda: [('Allow', 'role:Viewer', ['View'])]
+        self.assertNotEqual(acl_fingerprint(a), acl_fingerprint(b))
+        hash(acl_fingerprint(b))
+
+
+class GetViewGroupTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    @property
+    def _fut(self):
+        from betahaus.viewcomponent.models import get_view_group
+        return get_view_group
+
+    def _add(self, group = 'group', name = 'one'):
+        from betahaus.viewcomponent.models import add_view_action
+        return add_view_action(_name_callable, group, name, registry = self.config.registry)
+
+    def test_lookup_cached(self):
+        self._add()
+        registry = self.config.registry
+        vg = self._fut(registry, 'group')
+        self.failUnless(vg is registry.getUtility(IViewGroup, name = 'group'))
+        lookups = []
+        registry.getUtility = lambda *args, **kw: lookups.append(args)
+        self.failUnless(self._fut(registry, 'group') is vg)
+        self.assertEqual(lookups, [])
+
+    def test_missing_raises(self):
+        from zope.interface.interfaces import ComponentLookupError
+        self.assertRaises(ComponentLookupError, self._fut, self.config.registry, '404')
+        self._add('404')
+        self.assertEqual(self._fut(self.config.registry, '404').name, '404')
+
+    def test_invalidated_on_unregister(self):
+        from zope.interface.interfaces import ComponentLookupError
+        self._add()
+        registry = self.config.registry
+        self._fut(registry, 'group')
+        registry.unregisterUtility(provided = IViewGroup, name = 'group')
+        self.assertRaises(ComponentLookupError, self._fut, registry, 'group')
+
+    def test_invalidated_on_register(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        self._add()
+        registry = self.config.registry
+        self._fut(registry, 'group')
+        replacement = ViewGroup('group')
+        registry.registerUtility(replacement, IViewGroup, name = 'group')
+        self.failUnless(self._fut(registry, 'group') is replacement)
+
+
+class FreezeTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        obj = ViewGroup('group')
+        obj.add(ViewAction(_name_callable, 'one'))
+        obj.add(ViewAction(_name_callable, 'two', interface = contexts.IRoot))
+        obj.add(ViewAction(_name_callable, 'three', cache_key = lambda *args, **kw: None))
+        return obj
+
+    def test_freeze(self):
+        obj = self._group()
+        self.failIf(obj.frozen)
+        obj.freeze()
+        self.failUnless(obj.frozen)
+        self.assertEqual(obj(contexts.Root(), testing.DummyRequest()), 'onetwothree')
+        self.assertEqual(obj(None, testing.DummyRequest(), as_type = 'list', empty_val = '-'),
+                         ['one', '-', 'three'])
+
+    def test_mutation_raises(self):
+        from betahaus.viewcomponent.models import FrozenViewGroupError
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj.freeze()
+        self.assertRaises(FrozenViewGroupError, obj.add, ViewAction(_name_callable, 'four'))
+        self.assertRaises(FrozenViewGroupError, obj.__delitem__, 'one')
+        self.assertRaises(FrozenViewGroupError, setattr, obj, 'order', ['two', 'one'])
+        self.assertEqual(obj.order, ('one', 'two', 'three'))
+
+    def test_order_is_tuple(self):
+        obj = self._group()
+        obj.freeze()
+        self.assertRaises(AttributeError, getattr, obj.order, 'reverse')
+        self.assertEqual(obj(None, None), 'onethree')
+
+    def test_view_action_mutation_raises(self):
+        from betahaus.viewcomponent.models import FrozenViewGroupError
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = self._group()
+        va = obj['one']
+        va.title = u"One"
+        obj.freeze()
+        self.assertRaises(FrozenViewGroupError, setattr, va, 'permission', 'edit')
+        self.assertRaises(FrozenViewGroupError, ViewGroup('other').add, va)
+        self.assertEqual(va.permission, None)
+        self.assertEqual(va.title, u"One")
+
+    def test_direct(self):
+        obj = self._group()
+        self.failUnless(obj['one'].direct)
+        self.failIf(obj['three'].direct)
+
+    def test_direct_call(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        rendered = []
+        class _TrackedViewAction(ViewAction):
+            __slots__ = ()
+            def render(self, context, request, **kw):
+                rendered.append(self.name)
+        obj = ViewGroup('group')
+        obj.add(_TrackedViewAction(_name_callable, 'one'))
+        obj.add(_TrackedViewAction(_name_callable, 'three', cache_key = lambda *args, **kw: None))
+        self.assertEqual(obj(None, None), 'one')
+        self.assertEqual(rendered, ['three'])
+        obj.freeze()
+        del rendered[:]
+        self.assertEqual(obj(None, None), 'one')
+        self.assertEqual(rendered, ['three'])
+
+    def test_frozen_still_reports(self):
+        from betahaus.viewcomponent.stats import add_render_hook
+        from betahaus.viewcomponent.stats import remove_render_hook
+        obj = self._group()
+        obj.freeze()
+        reports = []
+        add_render_hook(reports.append)
+        try:
+            obj(None, None)
+        finally:
+            remove_render_hook(reports.append)
+        self.assertEqual([x.action for x in reports if x.status == 'rendered'], ['one', 'three'])
+
+    def test_directive(self):
+        from pyramid.config import Configurator
+        from betahaus.viewcomponent.models import FrozenViewGroupError
+        config = Configurator()
+        config.include('betahaus.viewcomponent')
+        config.add_view_action(_name_callable, 'group', 'one')
+        config.freeze_view_groups()
+        vg = config.registry.getUtility(IViewGroup, name = 'group')
+        self.failIf(vg.frozen)
+        config.commit()
+        self.failUnless(vg.frozen)
+        self.assertRaises(FrozenViewGroupError, config.add_view_action, _name_callable, 'group', 'two')
+
+    def test_setting(self):
+        from pyramid.config import Configurator
+        config = Configurator(settings = {'betahaus.viewcomponent.freeze': 'true'})
+        config.include('betahaus.viewcomponent')
+        config.add_view_action(_name_callable, 'group', 'one')
+        config.commit()
+        self.failUnless(config.registry.getUtility(IViewGroup, name = 'group').frozen)
+
+
+class SlotsTests(TestCase):
+
+    def test_view_action_has_no_dict(self):
+        from betahaus.viewcomponent.models import ViewAction
+        va = ViewAction(_name_callable, 'one')
+        self.failIf(hasattr(va, '__dict__'))
+        self.assertRaises(AttributeError, setattr, va, 'something', 1)
+
+    def test_view_group_has_no_dict(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        self.failIf(hasattr(obj, '__dict__'))
+
+    def test_view_group_implements(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        self.failUnless(verifyObject(IViewGroup, ViewGroup('group')))
+        self.failUnless(verifyObject(IViewAction, ViewAction(_name_callable, 'one')))
+
+    def test_empty_kwargs_shared(self):
+        from betahaus.viewcomponent.models import ViewAction
+        one = ViewAction(_name_callable, 'one')
+        two = ViewAction(_name_callable, 'two')
+        self.failUnless(one.kwargs is two.kwargs)
+        self.assertEqual(one.kwargs, {})
+        self.assertRaises(TypeError, one.kwargs.__setitem__, 'a', 1)
+        self.assertRaises(TypeError, one.kwargs.update, a = 1)
+
+    def test_empty_kwargs_inplace_or(self):
+        import operator
+        from betahaus.viewcomponent.models import ViewAction
+        one = ViewAction(_name_callable, 'one')
+        self.assertRaises(TypeError, operator.ior, one.kwargs, {'leak': 1})
+        self.assertEqual(ViewAction(_name_callable, 'two').kwargs, {})
+
+    def test_kwargs_with_options(self):
+        from betahaus.viewcomponent.models import ViewAction
+        va = ViewAction(_name_callable, 'one', delay = 1)
+        self.assertEqual(va.kwargs, {'delay': 1})
+        va.kwargs['delay'] = 2
+        self.assertEqual(va.kwargs['delay'], 2)
+
+    def test_subclasses_may_add_attributes(self):
+        from betahaus.viewcomponent.models import ViewAction
+        class _Custom(ViewAction):
+            pass
+        va = _Custom(_name_callable, 'one')
+        va.something = 1
+        self.assertEqual(va.something, 1)
+
+
+class DeferredTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        self.called = called = []
+        def _tracked(context, request, va, **kw):
+            called.append(va.name)
+            return va.name
+        obj = ViewGroup('group')
+        obj.add(ViewAction(_tracked, 'one'))
+        obj.add(ViewAction(_tracked, 'slow', deferred = True))
+        obj.add(ViewAction(_tracked, 'hidden', deferred = True, interface = contexts.IOrganisation))
+        obj.add(ViewAction(_tracked, 'three'))
+        return obj
+
+    def test_placeholder(self):
+        obj = self._group()
+        request = testing.DummyRequest()
+        self.assertEqual(obj(None, request, as_type = 'list'),
+                         ['one', '<div data-deferred="deferred-0"></div>', 'three'])
+        self.assertEqual(self.called, ['one', 'three'])
+
+    def test_render_deferred(self):
+        from betahaus.viewcomponent import render_deferred
+        from betahaus.viewcomponent.deferred import pending_deferred
+        obj = self._group()
+        request = testing.DummyRequest()
+        obj(None, request)
+        obj(None, request)
+        self.assertEqual(pending_deferred(request), 2)
+        self.assertEqual(render_deferred(request), [('deferred-0', 'slow'), ('deferred-1', 'slow')])
+        self.assertEqual(pending_deferred(request), 0)
+        self.assertEqual(render_deferred(request), [])
+
+    def test_render_deferred_nothing(self):
+        from betahaus.viewcomponent import render_deferred
+        self.assertEqual(render_deferred(testing.DummyRequest()), [])
+
+    def test_render_deferred_concurrent(self):
+        from betahaus.viewcomponent import render_deferred
+        obj = self._group()
+        request = testing.DummyRequest()
+        self.assertEqual(obj(None, request, as_type = 'dict', concurrent = True),
+                         {'one': 'one', 'slow': '<div data-deferred="deferred-0"></div>', 'three': 'three'})
+        self.assertEqual(render_deferred(request, concurrent = True), [('deferred-0', 'slow')])
+
+    def test_custom_placeholder(self):
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj.add(ViewAction(_name_callable, 'custom', deferred = True,
+                           placeholder = lambda context, request, va, key: '[%s:%s]' % (va.name, key)))
+        self.assertEqual(obj(None, testing.DummyRequest(), spacer = ' '),
+                         'one <div data-deferred="deferred-0"></div> three [custom:deferred-1]')
+
+    def test_nested_deferred(self):
+        from betahaus.viewcomponent import render_deferred
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        inner = self._group()
+        def _outer(context, request, va, **kw):
+            return inner(context, request, spacer = ' ')
+        obj = ViewGroup('outer')
+        obj.add(ViewAction(_outer, 'outer', deferred = True))
+        request = testing.DummyRequest()
+        self.assertEqual(obj(None, request), '<div data-deferred="deferred-0"></div>')
+        self.assertEqual(render_deferred(request),
+                         [('deferred-0', 'one <div data-deferred="deferred-1"></div> three'),
+                          ('deferred-1', 'slow')])
+
+    def test_not_direct(self):
+        obj = self._group()
+        self.failIf(obj['slow'].direct)
+        obj.freeze()
+        self.assertEqual(obj(None, testing.DummyRequest(), as_type = 'list')[1],
+                         '<div data-deferred="deferred-0"></div>')
+
+
+class ShortCircuitTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        from betahaus.viewcomponent.models import ViewAction
+        self.called = called = []
+        self.checked = checked = []
+        def _tracked(context, request, va, **kw):
+            called.append(va.name)
+            return va.kwargs.get('output', va.name)
+        def _checker(permission, context, request):
+            checked.append(permission)
+            return permission != 'denied'
+        obj = ViewGroup('group', perm_checker = _checker)
+        obj.add(ViewAction(_tracked, 'empty', output = ''))
+        obj.add(ViewAction(_tracked, 'denied', permission = 'denied'))
+        obj.add(ViewAction(_tracked, 'one', permission = 'one'))
+        obj.add(ViewAction(_tracked, 'two', permission = 'two'))
+        obj.add(ViewAction(_tracked, 'three', permission = 'three'))
+        return obj
+
+    def test_as_first(self):
+        obj = self._group()
+        self.assertEqual(obj.as_first(None, None), 'one')
+        self.assertEqual(self.called, ['empty', 'one'])
+        self.assertEqual(self.checked, ['denied', 'one'])
+
+    def test_as_first_as_type(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'first'), 'one')
+
+    def test_as_first_nothing(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        self.assertEqual(obj.as_first(None, None), None)
+        self.assertEqual(obj.as_first(None, None, empty_val = '-'), '-')
+
+    def test_as_list_limit(self):
+        obj = self._group()
+        self.assertEqual(obj.as_list(None, None, limit = 2), ['one', 'two'])
+        self.assertEqual(self.called, ['empty', 'one', 'two'])
+        self.assertEqual(self.checked, ['denied', 'one', 'two'])
+
+    def test_as_list_limit_empty_val(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'list', limit = 1, empty_val = '-'), ['-', '-', 'one'])
+
+    def test_as_list_limit_more_than_available(self):
+        obj = self._group()
+        self.assertEqual(obj.as_list(None, None, limit = 10), ['one', 'two', 'three'])
+
+    def test_as_list_limit_zero(self):
+        obj = self._group()
+        self.assertEqual(obj.as_list(None, None, limit = 0), [])
+        self.assertEqual(self.called, [])
+
+    def test_as_list_limit_concurrent(self):
+        obj = self._group()
+        self.assertEqual(obj.as_list(None, None, limit = 1, concurrent = True), ['one'])
+
+    def test_process_not_started(self):
+        from betahaus.viewcomponent import pool
+        from betahaus.viewcomponent.fixtures import process
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj.add(ViewAction(process.square, 'square', permission = 'square', process = True))
+        submitted = []
+        original = pool.submit_process
+        def _submit(*args):
+            submitted.append(args)
+            return original(*args)
+        pool.submit_process = _submit
+        try:
+            self.assertEqual(obj.as_first(None, None), 'one')
+            self.assertEqual(obj.as_list(None, None, limit = 2), ['one', 'two'])
+        finally:
+            pool.submit_process = original
+            pool.shutdown()
+        self.assertEqual(self.checked, ['denied', 'one', 'denied', 'one', 'two'])
+        self.assertEqual(submitted, [])
+
+    def test_process_reached(self):
+        from betahaus.viewcomponent import pool
+        from betahaus.viewcomponent.fixtures import process
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj.add(ViewAction(process.square, 'square', process = True))
+        try:
+            self.assertEqual(obj.as_list(None, None, limit = 4), ['one', 'two', 'three', 'square:0'])
+        finally:
+            pool.shutdown()
+
+
+class _PrincipalsRequest(object):
+
+    def __init__(self, *principals):
+        self.effective_principals = ['system.Everyone'] + list(principals)
+
+
+class VisibilityCacheTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.checked = []
+
+    def tearDown(self):
+        testing.tearDown()
+
+    @property
+    def _cut(self):
+        from betahaus.viewcomponent.cache import VisibilityCache
+        return VisibilityCache
+
+    def _checker(self, permission, context, request):
+        self.checked.append((permission, context))
+        return 'role:Admin' in request.effective_principals
+
+    def _context(self, acl = None):
+        root = testing.DummyResource()
+        root.__acl__ = acl or [('Allow', 'role:Admin', ['View'])]
+        root['a'] = testing.DummyResource()
+        return root['a']
+
+    def test_shared_between_requests(self):
+        obj = self._cut()
+        context = self._context()
+        self.failUnless(obj.check(self._checker, 'View', context, _PrincipalsRequest('role:Admin')))
+        self.failUnless(obj.check(self._checker, 'View', self._context(), _PrincipalsRequest('role:Admin')))
+        self.assertEqual(len(self.checked), 1)
+        self.assertEqual((obj.hits, obj.misses), (1, 1))
+
+    def test_keyed_by_principals(self):
+        obj = self._cut()
+        context = self._context()
+        self.failUnless(obj.check(self._checker, 'View', context, _PrincipalsRequest('role:Admin')))
+        self.failIf(obj.check(self._checker, 'View', context, _PrincipalsRequest('role:Viewer')))
+        self.failIf(obj.check(self._checker, 'View', context, _PrincipalsRequest('role:Viewer')))
+        self.assertEqual(len(self.checked), 2)
+
+    def test_keyed_by_acl_and_type(self):
+        obj = self._cut()
+        request = _PrincipalsRequest('role:Admin')
+        obj.check(self._checker, 'View', self._context(), request)
+        obj.check(self._checker, 'View', self._context([('Allow', 'role:Admin', ['Edit'])]), request)
+        obj.check(self._checker, 'View', contexts.Root(), request)
+        obj.check(self._checker, 'Edit', self._context(), request)
+        self.assertEqual(len(self.checked), 4)
+
+    def test_lru(self):
+        obj = self._cut(size = 2)
+        context = self._context()
+        for role in ('one', 'two', 'three', 'one'):
+            obj.check(self._checker, 'View', context, _PrincipalsRequest(role))
+        self.assertEqual(len(obj), 2)
+        self.assertEqual(len(self.checked), 4)
+
+    def test_no_principals(self):
+        obj = self._cut()
+        checker = lambda permission, context, request: True
+        self.failUnless(obj.check(checker, 'View', self._context(), None))
+        self.assertEqual(len(obj), 0)
+
+    def test_principals_looked_up_once(self):
+        from betahaus.viewcomponent.cache import request_principals
+        request = _PrincipalsRequest('role:Admin')
+        self.assertEqual(request_principals(request), frozenset(['system.Everyone', 'role:Admin']))
+        request.effective_principals = []
+        self.assertEqual(request_principals(request), frozenset(['system.Everyone', 'role:Admin']))
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group', perm_checker = self._checker, visibility_cache = self._cut())
+        obj.add(ViewAction(_name_callable, 'one', permission = 'View'))
+        obj.add(ViewAction(_name_callable, 'two', permission = 'View'))
+        obj.add(ViewAction(_name_callable, 'three', permission = 'Edit'))
+        return obj
+
+    def test_view_group(self):
+        obj = self._group()
+        for i in range(3):
+            self.assertEqual(obj(self._context(), _PrincipalsRequest('role:Admin')), 'onetwothree')
+        self.assertEqual(sorted([x[0] for x in self.checked]), ['Edit', 'View'])
+
+    def test_cleared_when_group_changes(self):
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj(self._context(), _PrincipalsRequest('role:Admin'))
+        self.assertEqual(len(obj.visibility_cache), 1)
+        obj.add(ViewAction(_name_callable, 'four', permission = 'View'))
+        self.assertEqual(len(obj.visibility_cache), 0)
+
+    def test_setting(self):
+        from betahaus.viewcomponent.models import add_view_action
+        self.config.registry.settings['betahaus.viewcomponent.visibility_cache'] = '10'
+        add_view_action(_name_callable, 'group', 'one', registry = self.config.registry)
+        vg = self.config.registry.getUtility(IViewGroup, name = 'group')
+        self.assertEqual(vg.visibility_cache.size, 10)
+
+
+class RenderMemoTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.called = []
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _callable(self, context, request, va, **kw):
+        self.called.append(va.name)
+        return va.name
+
+    def _request(self):
+        from betahaus.viewcomponent.cache import enable_render_memo
+        request = testing.DummyRequest()
+        enable_render_memo(request)
+        return request
+
+    def _add(self, name, group = 'group', **kw):
+        from betahaus.viewcomponent.models import add_view_action
+        return add_view_action(self._callable, group, name, registry = self.config.registry, **kw)
+
+    def _fut(self, *args, **kw):
+        from betahaus.viewcomponent import render_view_group
+        return render_view_group(*args, **kw)
+
+    def test_reused(self):
+        self._add('one')
+        self._add('two')
+        request = self._request()
+        context = testing.DummyResource()
+        self.assertEqual(self._fut(context, request, 'group'), 'onetwo')
+        self.assertEqual(self._fut(context, request, 'group'), 'onetwo')
+        self.assertEqual(self.called, ['one', 'two'])
+
+    def test_keyed_by_arguments_and_context(self):
+        self._add('one')
+        request = self._request()
+        context = testing.DummyResource()
+        self._fut(context, request, 'group')
+        self._fut(context, request, 'group', spacer = ' ')
+        self._fut(context, request, 'group', as_type = 'list')
+        self._fut(context, request, 'group', extra = 1)
+        self._fut(testing.DummyResource(), request, 'group')
+        self.assertEqual(len(self.called), 5)
+
+    def test_lists_are_copied(self):
+        self._add('one')
+        request = self._request()
+        res = self._fut(None, request, 'group', as_type = 'list')
+        res.append('changed')
+        self.assertEqual(self._fut(None, request, 'group', as_type = 'list'), ['one'])
+
+    def test_generators_not_memoized(self):
+        self._add('one')
+        request = self._request()
+        for as_type in ('generator', 'stream', 'generator', 'stream'):
+            list(self._fut(None, request, 'group', as_type = as_type))
+        self.assertEqual(len(self.called), 4)
+
+    def test_unhashable_arguments(self):
+        self._add('one')
+        request = self._request()
+        self._fut(None, request, 'group', extra = [])
+        self._fut(None, request, 'group', extra = [])
+        self.assertEqual(len(self.called), 2)
+
+    def test_not_enabled(self):
+        self._add('one')
+        request = testing.DummyRequest()
+        self._fut(None, request, 'group')
+        self._fut(None, request, 'group')
+        self.assertEqual(len(self.called), 2)
+
+    def test_view_action_opt_out(self):
+        self._add('one')
+        self._add('random', idempotent = False)
+        request = self._request()
+        self._fut(None, request, 'group')
+        self._fut(None, request, 'group')
+        self.assertEqual(self.called, ['one', 'random', 'one', 'random'])
+
+    def test_group_opt_out(self):
+        self._add('one')
+        self.config.registry.getUtility(IViewGroup, name = 'group').idempotent = False
+        request = self._request()
+        self._fut(None, request, 'group')
+        self._fut(None, request, 'group')
+        self.assertEqual(len(self.called), 2)
+
+    def test_memoizable_updated(self):
+        self._add('one')
+        vg = self.config.registry.getUtility(IViewGroup, name = 'group')
+        self.failUnless(vg.memoizable)
+        self._add('random', idempotent = False)
+        self.failIf(vg.memoizable)
+
+    def test_render_view_action(self):
+        from betahaus.viewcomponent import render_view_action
+        self._add('one')
+        self._add('random', idempotent = False)
+        request = self._request()
+        for i in range(2):
+            self.assertEqual(render_view_action(None, request, 'group', 'one'), 'one')
+            self.assertEqual(render_view_action(None, request, 'group', 'random'), 'random')
+        self.assertEqual(self.called, ['one', 'random', 'random'])
+
+    def test_setting(self):
+        from pyramid.events import NewRequest
+        from betahaus.viewcomponent.cache import get_render_memo
+        self.config.registry.settings['betahaus.viewcomponent.render_memo'] = 'true'
+        self.config.include('betahaus.viewcomponent')
+        request = testing.DummyRequest()
+        self.config.registry.notify(NewRequest(request))
+        self.failUnless(get_render_memo(request) is not None)
+
+
+class ETagTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.versions = {'one': 1, 'two': 1}
+        self.called = []
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _version(self, context, request, va, **kw):
+        return self.versions.get(va.name)
+
+    def _callable(self, context, request, va, **kw):
+        self.called.append(va.name)
+        return va.name
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(self._callable, 'one', version = self._version))
+        obj.add(ViewAction(self._callable, 'two', version = self._version))
+        obj.add(ViewAction(self._callable, 'org', interface = contexts.IOrganisation))
+        return obj
+
+    def test_etag(self):
+        obj = self._group()
+        etag = obj.etag(None, None)
+        self.failUnless(etag)
+        self.assertEqual(obj.etag(None, None), etag)
+        self.assertEqual(self.called, [])
+
+    def test_changes_with_version(self):
+        obj = self._group()
+        etag = obj.etag(None, None)
+        self.versions['two'] = 2
+        self.assertNotEqual(obj.etag(None, None), etag)
+
+    def test_differs_between_groups(self):
+        obj = self._group()
+        other = self._group()
+        other.name = 'other'
+        self.assertNotEqual(obj.etag(None, None), other.etag(None, None))
+
+    def test_no_version(self):
+        obj = self._group()
+        self.assertEqual(obj.etag(contexts.Organisation(), None), None)
+
+    def test_version_none(self):
+        obj = self._group()
+        del self.versions['one']
+        self.assertEqual(obj.etag(None, None), None)
+
+    def test_not_reported(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.stats import add_render_hook
+        from betahaus.viewcomponent.stats import remove_render_hook
+        obj = self._group()
+        obj.perm_checker = lambda *args: False
+        obj.add(ViewAction(self._callable, 'denied', permission = 'View', version = self._version))
+        reports = []
+        add_render_hook(reports.append)
+        try:
+            etag = obj.etag(None, None)
+        finally:
+            remove_render_hook(reports.append)
+        self.assertEqual(reports, [])
+        self.failUnless(etag)
+        self.versions['denied'] = 1
+        obj.perm_checker = lambda *args: True
+        self.assertNotEqual(obj.etag(None, None), etag)
+
+    def test_budget(self):
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj.add(ViewAction(self._callable, 'budget', version = self._version, budget = 1))
+        self.versions['budget'] = 1
+        self.assertEqual(obj.etag(None, None), None)
+
+    def test_breaker(self):
+        from betahaus.viewcomponent.breaker import CircuitBreaker
+        from betahaus.viewcomponent.models import ViewAction
+        obj = self._group()
+        obj.add(ViewAction(self._callable, 'breaker', version = self._version, breaker = CircuitBreaker()))
+        self.versions['breaker'] = 1
+        self.assertEqual(obj.etag(None, None), None)
+
+    def test_kw_passed(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(_name_callable, 'one', version = lambda context, request, va, **kw: kw['page']))
+        self.assertNotEqual(obj.etag(None, None, page = 1), obj.etag(None, None, page = 2))
+
+    def test_view_group_etag(self):
+        from betahaus.viewcomponent import view_group_etag
+        from betahaus.viewcomponent.models import add_view_action
+        add_view_action(_name_callable, 'group', 'one', registry = self.config.registry, version = self._version)
+        request = testing.DummyRequest()
+        self.failUnless(view_group_etag(None, request, 'group'))
+
+
+class BudgetTests(TestCase):
+    def setUp(self):
+        import threading
+        self.config = testing.setUp()
+        self.event = threading.Event()
+        self.reports = []
+        from betahaus.viewcomponent.stats import add_render_hook
+        add_render_hook(self.reports.append)
+
+    def tearDown(self):
+        from betahaus.viewcomponent.stats import remove_render_hook
+        remove_render_hook(self.reports.append)
+        self.event.set()
+        testing.tearDown()
+
+    def _slow(self, context, request, va, **kw):
+        self.event.wait(5)
+        return va.name
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(_name_callable, 'one'))
+        obj.add(ViewAction(self._slow, 'slow', budget = 0.05, fallback = 'fallback'))
+        obj.add(ViewAction(_name_callable, 'fast', budget = 5))
+        obj.add(ViewAction(self._slow, 'slow_empty', budget = 0.05))
+        return obj
+
+    def test_fallback(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'list'), ['one', 'fallback', 'fast'])
+        self.assertEqual([x.action for x in self.reports if x.status == 'overrun'], ['slow', 'slow_empty'])
+
+    def test_as_dict_empty_val(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'dict', empty_val = '-'),
+                         {'one': 'one', 'slow': 'fallback', 'fast': 'fast', 'slow_empty': '-'})
+
+    def test_concurrent(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, concurrent = True), 'onefallbackfast')
+
+    def test_within_budget(self):
+        obj = self._group()
+        self.event.set()
+        self.assertEqual(obj(None, None), 'oneslowfastslow_empty')
+        self.assertEqual([x for x in self.reports if x.status == 'overrun'], [])
+
+    def test_exception_propagates(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(_dummy_callable, 'fails', budget = 5))
+        self.assertRaises(TypeError, obj, None, None, extra = 1)
+
+    def test_not_direct(self):
+        obj = self._group()
+        self.failIf(obj['fast'].direct)
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        self.now = 0.0
+        self.failing = True
+        self.called = []
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _clock(self):
+        return self.now
+
+    def _cut(self, **kw):
+        from betahaus.viewcomponent.breaker import CircuitBreaker
+        kw.setdefault('clock', self._clock)
+        return CircuitBreaker(**kw)
+
+    def _callable(self, context, request, va, **kw):
+        self.called.append(va.name)
+        if self.failing:
+            raise ValueError()
+        return va.name
+
+    def test_trips(self):
+        obj = self._cut(failures = 2, window = 10)
+        obj.failure()
+        self.assertEqual(obj.state, 'closed')
+        obj.failure()
+        self.assertEqual(obj.state, 'open')
+        self.failIf(obj.allow())
+        self.assertEqual(obj.info(), {'state': 'open', 'failures': 0, 'opened_at': 0.0, 'trips': 1})
+
+    def test_window(self):
+        obj = self._cut(failures = 2, window = 10)
+        obj.failure()
+        self.now = 11
+        obj.failure()
+        self.assertEqual(obj.state, 'closed')
+
+    def test_slow(self):
+        obj = self._cut(failures = 1, slow = 0.5)
+        obj.success(0.1)
+        self.assertEqual(obj.state, 'closed')
+        obj.success(1)
+        self.assertEqual(obj.state, 'open')
+
+    def test_cooldown(self):
+        obj = self._cut(failures = 1, cooldown = 30)
+        obj.failure()
+        self.now = 29
+        self.failIf(obj.allow())
+        self.now = 30
+        self.failUnless(obj.allow())
+        self.assertEqual(obj.state, 'half_open')
+        #Only one trial at a time
+        self.failIf(obj.allow())
+        obj.success()
+        self.assertEqual(obj.state, 'closed')
+        self.failUnless(obj.allow())
+
+    def test_failed_trial(self):
+        obj = self._cut(failures = 1, cooldown = 30)
+        obj.failure()
+        self.now = 30
+        obj.allow()
+        obj.failure()
+        self.assertEqual(obj.state, 'open')
+        self.assertEqual(obj.opened_at, 30)
+        self.assertEqual(obj.trips, 2)
+
+    def test_reset(self):
+        obj = self._cut(failures = 1)
+        obj.failure()
+        obj.reset()
+        self.failUnless(obj.allow())
+
+    def _group(self, **kw):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(_name_callable, 'one'))
+        obj.add(ViewAction(self._callable, 'flaky', breaker = self._cut(failures = 2, cooldown = 30), **kw))
+        return obj
+
+    def test_view_action(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'list'), ['one'])
+        self.assertEqual(obj(None, None, as_type = 'list'), ['one'])
+        self.assertEqual(obj['flaky'].kwargs['breaker'].state, 'open')
+        obj(None, None)
+        self.assertEqual(self.called, ['flaky', 'flaky'])
+        self.failing = False
+        self.now = 30
+        self.assertEqual(obj(None, None, as_type = 'list'), ['one', 'flaky'])
+        self.assertEqual(obj['flaky'].kwargs['breaker'].state, 'closed')
+
+    def test_fallback(self):
+        obj = self._group(fallback = 'fallback')
+        self.assertEqual(obj(None, None, as_type = 'list'), ['one', 'fallback'])
+
+    def test_reports(self):
+        from betahaus.viewcomponent.stats import add_render_hook
+        from betahaus.viewcomponent.stats import remove_render_hook
+        obj = self._group()
+        reports = []
+        add_render_hook(reports.append)
+        try:
+            for i in range(3):
+                obj(None, None)
+        finally:
+            remove_render_hook(reports.append)
+        self.assertEqual([x.status for x in reports if x.action == 'flaky'], ['error', 'error', 'open'])
+
+    def test_not_direct(self):
+        obj = self._group()
+        self.failIf(obj['flaky'].direct)
+
+
+class ProcessPoolTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        from betahaus.viewcomponent import pool
+        pool.shutdown()
+        testing.tearDown()
+
+    def _group(self):
+        from betahaus.viewcomponent.fixtures import process
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(_name_kw_callable, 'one'))
+        obj.add(ViewAction(process.square, 'square', process = True))
+        obj.add(ViewAction(_name_kw_callable, 'three'))
+        obj.add(ViewAction(process.square, 'projected', process = True, project = process.project))
+        return obj
+
+    def test_render(self):
+        obj = self._group()
+        context = testing.DummyResource(__name__ = 'context')
+        self.assertEqual(obj(context, None, as_type = 'list', number = 3),
+                         ['one', 'square:9', 'three', 'projected:9'])
+
+    def test_concurrent(self):
+        obj = self._group()
+        context = testing.DummyResource(__name__ = 'context')
+        self.assertEqual(obj(context, None, spacer = ' ', concurrent = True), 'one square:0 three projected:4')
+
+    def test_other_process(self):
+        import os
+        from betahaus.viewcomponent.fixtures import process
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(process.pid, 'pid', process = True))
+        self.assertNotEqual(obj.as_list(None, None), [os.getpid()])
+
+    def test_exception(self):
+        from betahaus.viewcomponent.fixtures import process
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(process.fails, 'fails', process = True))
+        self.assertRaises(ValueError, obj, None, None)
+
+    def test_not_importable(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(lambda *args, **kw: '', 'lambda', process = True))
+        self.assertRaises(ValueError, obj, None, None)
+
+    def test_render_view_action(self):
+        import os
+        from betahaus.viewcomponent import render_view_action
+        from betahaus.viewcomponent.fixtures import process
+        from betahaus.viewcomponent.models import add_view_action
+        add_view_action(process.pid, 'group', 'pid', registry = self.config.registry, process = True)
+        add_view_action(process.square, 'group', 'projected', registry = self.config.registry,
+                        process = True, project = process.project)
+        request = testing.DummyRequest()
+        context = testing.DummyResource(__name__ = 'context')
+        self.assertNotEqual(render_view_action(context, request, 'group', 'pid'), os.getpid())
+        self.assertEqual(render_view_action(context, request, 'group', 'projected', number = 3),
+                         'projected:9')
+
+    @skipIf(not HAS_ASYNC, "asyncio support requires Python 3.6")
+    def test_render_async(self):
+        import asyncio
+        import os
+        from betahaus.viewcomponent.fixtures import process
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        obj = ViewGroup('group')
+        obj.add(ViewAction(process.pid, 'pid', process = True))
+        obj.add(ViewAction(process.square, 'projected', process = True, project = process.project))
+        context = testing.DummyResource(__name__ = 'context')
+        loop = asyncio.new_event_loop()
+        try:
+            res = loop.run_until_complete(obj.as_list_async(context, None))
+        finally:
+            loop.close()
+        self.assertNotEqual(res[0], os.getpid())
+        self.assertEqual(res[1], 'projected:4')
+
+    def test_uses_processes(self):
+        obj = self._group()
+        self.failUnless(obj.uses_processes)
+        del obj['square']
+        del obj['projected']
+        self.failIf(obj.uses_processes)
+
+    def test_dotted_name(self):
+        from betahaus.viewcomponent.fixtures import process
+        from betahaus.viewcomponent.pool import dotted_name
+        from betahaus.viewcomponent.pool import resolve
+        self.assertEqual(dotted_name(process.square), 'betahaus.viewcomponent.fixtures.process:square')
+        self.failUnless(resolve('betahaus.viewcomponent.fixtures.process:square') is process.square)
+
+    def test_configure_processes(self):
+        from betahaus.viewcomponent import pool
+        pool.configure_processes(2)
+        try:
+            self.assertEqual(pool.get_process_pool()._max_workers, 2)
+        finally:
+            pool.configure_processes(None)
+
+
+class BytesRenderTests(TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _group(self):
+        from betahaus.viewcomponent.models import ViewAction
+        from betahaus.viewcomponent.models import ViewGroup
+        self.view = memoryview(b'view')
+        outputs = {'text': u'\xe5', 'bytes': b'bytes', 'view': self.view,
+                   'array': bytearray(b'array'), 'empty': b'', 'empty_view': memoryview(b'')}
+        obj = ViewGroup('group')
+        for name in ('text', 'bytes', 'empty', 'view', 'empty_view', 'array'):
+            obj.add(ViewAction(lambda context, request, va, **kw: outputs[va.name], name))
+        return obj
+
+    def test_as_bytes(self):
+        obj = self._group()
+        res = obj.as_bytes(None, None)
+        self.failUnless(isinstance(res, bytes))
+        self.assertEqual(res, b'\xc3\xa5bytesviewarray')
+
+    def test_as_type(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'bytes', spacer = u'|', encoding = 'latin-1'),
+                         b'\xe5|bytes|view|array')
+
+    def test_empty_val(self):
+        obj = self._group()
+        self.assertEqual(obj(None, None, as_type = 'bytes', empty_val = u'-'),
+                         b'\xc3\xa5bytes-view-array')
+
+    @skipIf(not PY3, "Python 2 copies memoryviews")
+    def test_buffers_not_copied(self):
+        obj = self._group()
+        res = obj(None, None, as_type = 'buffers', spacer = ' ')
+        self.assertEqual(len(res), 7)
+        self.failUnless(res[4] is self.view)
+        self.assertEqual(b''.join(res), b'\xc3\xa5 bytes view array')
+
+    def test_buffers_app_iter(self):
+        from pyramid.response import Response
+        obj = self._group()
+        response = Response()
+        response.app_iter = obj.as_buffers(None, None)
+        self.assertEqual(response.body, b'\xc3\xa5bytesviewarray')
+
+    def test_nothing(self):
+        from betahaus.viewcomponent.models import ViewGroup
+        self.assertEqual(ViewGroup('group').as_bytes(None, None), b'')
@@ -1,4 +1,5 @@
 import os
+import sys
 
 from setuptools import setup, find_packages
 
@@ -11,6 +12,10 @@ requires = ('pyramid>=1.2',
             'venusian',
             'zope.interface',)
 
+concurrent_requires = ()
+if sys.version_info[0] < 3:
+    concurrent_requires = ('futures',)
+
 setup(name='betahaus.viewcomponent',
       version='0.4.1',
       description='Plugin structure for menus, JSON responses or similar.',
@@ -36,6 +41,7 @@ setup(name='betahaus.viewcomponent',
       include_package_data=True,
       zip_safe=False,
       install_requires=requires,
+      extras_require={'concurrent': concurrent_requires},
       tests_require=requires,
       test_suite="betahaus.viewcomponent",
       use_2to3=True,